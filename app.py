@@ -1,16 +1,43 @@
-from flask import Flask, request, render_template, jsonify
-import tempfile
-import shutil
-from processing import process_insurance_cards
+from flask import Flask, request, render_template, jsonify, Response
+from config import load_env
+# .env must be loaded before the pipeline modules read their settings
+load_env()
+from processing import process_insurance_card_uploads, validate_configuration, upload_targets
+from jobs import submit_job, get_job
+from uploads import ValidatingRequest, ALLOWED_EXTENSIONS, MAX_IMAGE_BYTES
+from errors import RequestRejected
+from metrics import start_request_timings, current_request_timings, time_stage, render_metrics, REQUEST_SECONDS
 import os
+import time
 from flask_cors import CORS
 import logging
 
 app = Flask(__name__)
+# Validate uploads (count, type, magic bytes, size) while the body streams in
+app.request_class = ValidatingRequest
 CORS(app)
 
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
 
+@app.before_request
+def start_timing():
+    start_request_timings()
+
+@app.after_request
+def add_timing(response):
+    """Record request latency and report per-stage timings in a Server-Timing header"""
+    timings = current_request_timings()
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.server_timing()
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - timings.started_at,
+                                method=request.method, endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_form_or_process():
     return handle_upload(None)
@@ -19,10 +46,29 @@ def upload_form_or_process():
 def upload_form_or_process_with_id(insurance_id):
     return handle_upload(insurance_id)
 
+@app.route('/upload-settings', methods=['GET'])
+def upload_settings_endpoint():
+    return jsonify(upload_settings())
+
+def upload_settings():
+    """What clients should send: images resized and encoded to these targets are used without re-encoding"""
+    return dict(upload_targets(), max_upload_bytes=MAX_IMAGE_BYTES)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    return jsonify(job)
+
+def wants_async():
+    """Async mode is opt-in per request via ?async=true or an 'async' form field"""
+    return request.values.get('async', '').lower() in ('1', 'true', 'yes')
+
 def handle_upload(insurance_id):
     if request.method == 'GET':
         try:
-            return render_template('upload.html')
+            return render_template('upload.html', upload_settings=upload_settings())
         except Exception as e:
             print(f"Template error: {e}")
             return jsonify({"error": "Template not found"}), 500
@@ -41,7 +87,7 @@ def handle_upload(insurance_id):
         if len(files) != 2:
             return jsonify({"error": "Please upload exactly two images (front and back of insurance card)."}), 400
         
-        allowed_extensions = {'.jpg', '.jpeg', '.png'}
+        # Already enforced while parsing; kept for requests that bypass ValidatingRequest
         for file in files:
             if not file.filename:
                 return jsonify({"error": "All files must have filenames."}), 400
@@ -49,37 +95,47 @@ def handle_upload(insurance_id):
             file_ext = os.path.splitext(file.filename.lower())[1]
             print(f"Received file: {file.filename}, extension: {file_ext}")
             
-            if file_ext not in allowed_extensions:
+            if file_ext not in ALLOWED_EXTENSIONS:
                 return jsonify({"error": f"File {file.filename} must be a JPG, JPEG, or PNG image."}), 400
         
-        temp_dir = tempfile.mkdtemp()
-        
-        try:
-            saved_files = []
-            for file in files:
-                file_path = os.path.join(temp_dir, file.filename)
-                file.save(file_path)
-                saved_files.append(file_path)
-                
-                if not os.path.exists(file_path):
-                    raise Exception(f"Failed to save file: {file.filename}")
-                
-                file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                print(f"Uploaded {file.filename}: {file_size_mb:.2f}MB")
-            
-            s3_url = process_insurance_cards(temp_dir, insurance_id, insurance_type)
+        # Uploads were validated and spooled while parsing; read them into memory for the pipeline
+        uploads = []
+        for file in files:
+            with time_stage("read_upload"):
+                image_data = file.read()
+            if not image_data:
+                raise Exception(f"Failed to read file: {file.filename}")
             
+            uploads.append((file.filename, image_data))
+            print(f"Uploaded {file.filename}: {len(image_data) / (1024 * 1024):.2f}MB")
+        
+        if wants_async():
+            # Fail fast on configuration problems, then hand off to the worker pool
+            validate_configuration()
+            job_id = submit_job(uploads, insurance_id, insurance_type)
             return jsonify({
-                "link": s3_url,
-                "message": f"{insurance_type.capitalize()} insurance cards processed successfully!",
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/jobs/{job_id}",
                 "insurance_id": insurance_id,
-                "insurance_type": insurance_type 
-            })
-            
-        finally:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
+                "insurance_type": insurance_type
+            }), 202
+        
+        result = process_insurance_card_uploads(uploads, insurance_id, insurance_type)
+        
+        return jsonify({
+            "link": result["link"],
+            "derivatives": result["derivatives"],
+            "message": f"{insurance_type.capitalize()} insurance cards processed successfully!",
+            "insurance_id": insurance_id,
+            "insurance_type": insurance_type 
+        })
                 
+    # Upload validation, image limits and a full job queue
+    except RequestRejected as e:
+        print(f"Request rejected ({type(e).__name__}): {e.message}")
+        return jsonify({"error": e.message}), e.status_code, e.headers
+    
     except Exception as e:
         error_msg = str(e)
         print(f"Error processing insurance cards: {error_msg}")
@@ -106,4 +162,9 @@ def internal_error(e):
     return jsonify({"error": "Internal server error. Please try again."}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8004, debug=True)
\ No newline at end of file
+    # FLASK_DEBUG=1 runs the reloading development server; otherwise serve with gunicorn
+    if os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes'):
+        app.run(host='0.0.0.0', port=8004, debug=True)
+    else:
+        from serve import run
+        run(app)
@@ -0,0 +1,417 @@
+"""
+Benchmark harness for the card-processing pipeline.
+
+Generates synthetic card photos (1MP to 12MP, JPEG and PNG, with and without
+an EXIF orientation), then times each stage and the end-to-end Flask upload
+with S3 and PostgreSQL replaced by local stand-ins. Every case runs in its
+own forked process so peak RSS is attributed to that case alone.
+
+It also times a cold import of the service modules (python -X importtime in
+a fresh interpreter) and fails if one of them eagerly imports an SDK that
+should only load on first use.
+
+Usage:
+    python benchmark.py                              # full matrix
+    python benchmark.py --quick                      # 1MP and 3MP only, fewer iterations
+    python benchmark.py --save-baseline bench.json   # record results
+    python benchmark.py --compare bench.json         # fail if p50 regressed
+    python benchmark.py --stages imports             # import times only
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# The pipeline validates AWS settings and caches duplicate uploads; neither
+# belongs in a benchmark, so configure both before processing is imported
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("S3_BUCKET", "benchmark-bucket")
+os.environ["DEDUP_CACHE_SIZE"] = "0"
+os.environ.pop("DEDUP_CACHE_PATH", None)
+
+from PIL import Image, ImageDraw, ImageFilter
+from psycopg2 import extensions as pg_extensions
+import processing
+
+MEGAPIXELS = (1, 3, 6, 12)
+STAGES = ("auto_rotate_image", "compress_image", "prepare_image", "convert_img_to_pdf", "build_pdf", "handle_upload")
+IMPORT_STAGE = "imports"
+
+# Modules timed by the import benchmark, and the SDKs each must not load at
+# import time (they are imported on first use; app.py is an entry point and
+# reads .env itself)
+LAZY_SDKS = ("boto3", "botocore", "psycopg2", "openai", "google.cloud.documentai", "googleapiclient")
+IMPORT_MODULES = {
+    "processing": LAZY_SDKS + ("dotenv",),
+    "scan": LAZY_SDKS + ("dotenv",),
+    "app": LAZY_SDKS,
+}
+
+# ---------------------------------------------------------------------------
+# Synthetic inputs
+
+def make_card_photo(megapixels, image_format, orientation=None, seed=0):
+    """Render a photo-like card image: noisy background, a card with text lines, optional EXIF orientation"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+
+    background = Image.effect_noise((width // 4, height // 4), 40 + seed).resize((width, height), Image.Resampling.BILINEAR)
+    img = Image.merge("RGB", (background, background.point(lambda v: v * 0.9), background.point(lambda v: v * 0.8)))
+
+    draw = ImageDraw.Draw(img)
+    card_box = (width // 8, height // 6, width * 7 // 8, height * 5 // 6)
+    draw.rounded_rectangle(card_box, radius=width // 40, fill=(235, 240, 250), outline=(20, 60, 140), width=max(2, width // 400))
+    line_height = max(10, height // 24)
+    for line in range(10):
+        y = card_box[1] + line_height * (line + 1)
+        draw.rectangle((card_box[0] + line_height, y, card_box[0] + line_height + (line * 97 % 9 + 4) * line_height, y + line_height // 2),
+                       fill=(30, 30, 60))
+        draw.text((card_box[2] - line_height * 8, y), f"MEMBER {seed}{line:04d}", fill=(0, 0, 0))
+    img = img.filter(ImageFilter.GaussianBlur(0.6))
+
+    output = BytesIO()
+    if image_format == "JPEG":
+        save_args = {"quality": 92}
+        if orientation:
+            exif = Image.Exif()
+            exif[processing.EXIF_ORIENTATION_TAG] = orientation
+            save_args["exif"] = exif
+        img.save(output, "JPEG", **save_args)
+    else:
+        img.save(output, "PNG", compress_level=6)
+    return output.getvalue()
+
+def shrink_like_client(image_data):
+    """What the upload page's compressImage sends: resized and encoded to the server's upload targets"""
+    targets = processing.upload_targets()
+    with Image.open(BytesIO(image_data)) as img:
+        img = img.convert("RGB")
+        img.thumbnail((targets["max_dimension"], targets["max_dimension"]))
+        output = BytesIO()
+        img.save(output, "JPEG", quality=targets["jpeg_quality"])
+    return output.getvalue()
+
+def input_cases(megapixels):
+    """(name, bytes, extension) for every size/format/orientation combination"""
+    for mp in megapixels:
+        photo = make_card_photo(mp, "JPEG")
+        yield f"{mp}MP-jpeg", photo, ".jpg"
+        yield f"{mp}MP-jpeg-client", shrink_like_client(photo), ".jpg"
+        yield f"{mp}MP-jpeg-exif6", make_card_photo(mp, "JPEG", orientation=6), ".jpg"
+        yield f"{mp}MP-png", make_card_photo(mp, "PNG"), ".png"
+
+# ---------------------------------------------------------------------------
+# Local stand-ins for S3 and PostgreSQL
+
+class FakeS3Client:
+    """Accepts upload_fileobj calls and keeps the bytes in memory"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        self.objects[(bucket, key)] = fileobj.read()
+
+class SqliteShimCursor:
+    def __init__(self, connection):
+        self._cursor = connection.execute("SELECT 1")
+        self._connection = connection
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        self._cursor = self._connection.execute(re.sub(r"%s", "?", query), tuple(params))
+        self.rowcount = self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class SqliteShimConnection:
+    """Just enough of a psycopg2 connection for processing's single-row statements, on in-memory SQLite"""
+
+    closed = 0
+
+    def __init__(self):
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE insurance_fresh (insurance_id TEXT PRIMARY KEY, primary_insurance_card TEXT, secondary_insurance_card TEXT);
+            CREATE TABLE insurance (insurance_id TEXT, primary_insurance_card TEXT, secondary_insurance_card TEXT);
+            CREATE TABLE interaction (channel TEXT, timestamp TEXT, length INTEGER, from_id INTEGER,
+                                      to_id INTEGER, attachment TEXT, raw_content TEXT);
+            INSERT INTO insurance_fresh (insurance_id) VALUES ('308');
+        """)
+
+    def cursor(self):
+        return SqliteShimCursor(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def get_transaction_status(self):
+        return pg_extensions.TRANSACTION_STATUS_IDLE
+
+class SqliteShimPool:
+    """Stands in for psycopg2's ThreadedConnectionPool with a single shared SQLite connection"""
+
+    def __init__(self):
+        self.connection = SqliteShimConnection()
+
+    def getconn(self):
+        return self.connection
+
+    def putconn(self, connection, close=False):
+        pass
+
+def install_stand_ins():
+    """Point processing at the fake S3 client and the SQLite database shim"""
+    import threading
+    processing._s3_client = FakeS3Client()
+    processing._db_pool = SqliteShimPool()
+    processing._db_pool_slots = threading.BoundedSemaphore(1)
+    processing.validate_configuration = lambda: None
+
+# ---------------------------------------------------------------------------
+# Measurement
+
+class EncodeCounter:
+    """Counts Image.save calls (encodes) per format while active"""
+
+    def __init__(self):
+        self.counts = {}
+        self._original_save = Image.Image.save
+
+    def __enter__(self):
+        counter = self
+
+        def counting_save(image, fp, format=None, **params):
+            name = (format or "file").upper()
+            counter.counts[name] = counter.counts.get(name, 0) + 1
+            return counter._original_save(image, fp, format, **params)
+
+        Image.Image.save = counting_save
+        return self
+
+    def __exit__(self, *exc_info):
+        Image.Image.save = self._original_save
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_stage(stage, image_data, extension, iterations):
+    """Time one stage on one input; returns the result dict (runs inside a forked child)"""
+    install_stand_ins()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    work_dir = tempfile.mkdtemp(prefix="card-bench-")
+    prepared = processing.prepare_image(image_data, "bench" + extension)
+    client = None
+    if stage == "handle_upload":
+        import app
+        client = app.app.test_client()
+
+    timings = []
+    with EncodeCounter() as encodes:
+        for iteration in range(iterations):
+            path = os.path.join(work_dir, f"card{extension}")
+            with open(path, "wb") as f:
+                f.write(image_data)
+
+            start = time.perf_counter()
+            if stage == "auto_rotate_image":
+                processing.auto_rotate_image(path)
+            elif stage == "compress_image":
+                processing.compress_image(path)
+            elif stage == "prepare_image":
+                processing.prepare_image(image_data, "bench" + extension)
+            elif stage == "convert_img_to_pdf":
+                processing.convert_img_to_pdf([path, path], os.path.join(work_dir, "out.pdf"))
+            elif stage == "build_pdf":
+                processing.build_pdf([prepared, prepared])
+            elif stage == "handle_upload":
+                response = client.post("/308", data={
+                    "images": [(BytesIO(image_data), "front" + extension), (BytesIO(image_data), "back" + extension)],
+                    "insurance_type": "primary",
+                }, content_type="multipart/form-data")
+                if response.status_code != 200:
+                    raise RuntimeError(f"handle_upload returned {response.status_code}: {response.get_json()}")
+            timings.append(time.perf_counter() - start)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "encodes_per_iteration": {name: count / iterations for name, count in encodes.counts.items()},
+    }
+
+def _run_stage_in_child(connection, stage, image_data, extension, iterations):
+    # Keep the per-stage progress prints out of the report
+    sys.stdout = open(os.devnull, "w")
+    try:
+        connection.send(run_stage(stage, image_data, extension, iterations))
+    except Exception as e:
+        connection.send({"error": str(e)})
+    finally:
+        connection.close()
+
+def run_case(stage, image_data, extension, iterations):
+    """Run a stage in a fresh forked process so its peak RSS is its own"""
+    context = multiprocessing.get_context("fork")
+    parent_end, child_end = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage_in_child, args=(child_end, stage, image_data, extension, iterations))
+    process.start()
+    child_end.close()
+    result = parent_end.recv()
+    process.join()
+    return result
+
+def time_import(module, iterations):
+    """
+    Cold-import module in fresh interpreters; cumulative import time
+    percentiles and any forbidden SDKs it pulled in.
+    """
+    durations = []
+    loaded = set()
+    for _ in range(iterations):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1]}
+        # Lines look like "import time:  self [us] | cumulative | <indent>name"
+        for line in completed.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            loaded.add(name.strip())
+            if name.rstrip() == f" {module}":
+                durations.append(int(cumulative) / 1000)
+    durations.sort()
+    forbidden = IMPORT_MODULES[module]
+    return {
+        "p50_ms": percentile(durations, 0.50),
+        "p95_ms": percentile(durations, 0.95),
+        "p99_ms": percentile(durations, 0.99),
+        "eager_imports": sorted(sdk for sdk in forbidden if sdk in loaded),
+    }
+
+# ---------------------------------------------------------------------------
+# Reporting
+
+def compare_to_baseline(results, baseline, max_regression):
+    """Print p50 changes against a saved baseline; return the keys that regressed beyond max_regression"""
+    regressions = []
+    for key, result in sorted(results.items()):
+        previous = baseline.get("results", {}).get(key)
+        if not previous or "p50_ms" not in previous or "p50_ms" not in result:
+            continue
+        change = (result["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"]
+        marker = "  REGRESSION" if change > max_regression else ""
+        print(f"{key:45s} {previous['p50_ms']:9.1f}ms -> {result['p50_ms']:9.1f}ms ({change:+.0%}){marker}")
+        if marker:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the insurance card processing pipeline.")
+    parser.add_argument("--megapixels", type=int, nargs="+", default=list(MEGAPIXELS), help="Photo sizes to generate")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES) + [IMPORT_STAGE], choices=STAGES + (IMPORT_STAGE,),
+                        help="Stages to time")
+    parser.add_argument("--iterations", type=int, default=10, help="Timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="1MP and 3MP only, 3 iterations")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="Compare p50 latency against a saved baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p50 slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.megapixels = [mp for mp in args.megapixels if mp <= 3] or [1]
+        args.iterations = 3
+
+    settings = {
+        "MAX_DIMENSION": processing.MAX_DIMENSION,
+        "JPEG_QUALITY": processing.JPEG_QUALITY,
+        "MAX_FILE_SIZE_MB": processing.MAX_FILE_SIZE_MB,
+        "RESIZE_FILTER": processing.RESIZE_FILTER,
+    }
+    print(f"Settings: {settings}")
+    print(f"{'case':45s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'peak RSS':>10s}  encodes")
+
+    results = {}
+    eager_imports = []
+    if IMPORT_STAGE in args.stages:
+        for module in IMPORT_MODULES:
+            key = f"{IMPORT_STAGE}/{module}"
+            result = time_import(module, args.iterations)
+            results[key] = result
+            if "error" in result:
+                print(f"{key:45s} ERROR: {result['error']}")
+                continue
+            eager = ", ".join(result["eager_imports"])
+            print(f"{key:45s} {result['p50_ms']:8.1f}ms {result['p95_ms']:8.1f}ms {result['p99_ms']:8.1f}ms "
+                  f"{'':>10s}  {'eager: ' + eager if eager else ''}")
+            eager_imports.extend(f"{module} -> {sdk}" for sdk in result["eager_imports"])
+
+    image_stages = [stage for stage in args.stages if stage != IMPORT_STAGE]
+    for name, image_data, extension in (input_cases(args.megapixels) if image_stages else ()):
+        for stage in image_stages:
+            key = f"{stage}/{name}"
+            result = run_case(stage, image_data, extension, args.iterations)
+            results[key] = result
+            if "error" in result:
+                print(f"{key:45s} ERROR: {result['error']}")
+                continue
+            encodes = ", ".join(f"{fmt}={count:g}" for fmt, count in sorted(result["encodes_per_iteration"].items()))
+            print(f"{key:45s} {result['p50_ms']:8.1f}ms {result['p95_ms']:8.1f}ms {result['p99_ms']:8.1f}ms "
+                  f"{result['peak_rss_mb']:8.0f}MB  {encodes}")
+
+    report = {"created_at": time.time(), "python": sys.version.split()[0], "settings": settings, "results": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    failed = False
+    if eager_imports:
+        print(f"SDKs imported eagerly: {', '.join(eager_imports)}")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.max_regression:.0%}")
+            failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
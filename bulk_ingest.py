@@ -0,0 +1,252 @@
+"""
+Bulk ingest of scanned insurance cards.
+
+Builds card PDFs for many front/back pairs at once, uploads them to S3 and
+records them in the database in batched transactions. Progress is written to
+a checkpoint file so an interrupted run can be resumed.
+
+Input is either a manifest CSV with columns insurance_id,type,front,back
+(image paths relative to the manifest), or a directory tree laid out as
+
+    <root>/<insurance_id>/front.jpg, back.jpg              (primary card)
+    <root>/<insurance_id>/<primary|secondary>/front.jpg, back.jpg
+
+Usage:
+    python bulk_ingest.py --manifest cards.csv
+    python bulk_ingest.py --root ./partner_scans --workers 8
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import load_env
+# .env must be loaded before the pipeline modules read their settings
+load_env()
+from processing import (
+    prepare_image,
+    build_pdf,
+    upload_to_s3,
+    update_insurance_cards_in_db,
+    validate_configuration,
+)
+
+INSURANCE_TYPES = ('primary', 'secondary')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Insurance IDs as they appear in upload URLs (e.g. /308)
+INSURANCE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def read_manifest(manifest_path):
+    """Read (insurance_id, insurance_type, front_path, back_path) rows from a manifest CSV"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    cards = []
+    with open(manifest_path, newline='') as f:
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            insurance_id = (row.get('insurance_id') or '').strip()
+            if not INSURANCE_ID_PATTERN.fullmatch(insurance_id):
+                raise ValueError(f"{manifest_path}:{line_number}: invalid insurance_id '{insurance_id}'")
+            insurance_type = (row.get('type') or 'primary').strip().lower()
+            if insurance_type not in INSURANCE_TYPES:
+                raise ValueError(f"{manifest_path}:{line_number}: unknown insurance type '{insurance_type}'")
+            cards.append((
+                insurance_id,
+                insurance_type,
+                os.path.join(base_dir, row['front'].strip()),
+                os.path.join(base_dir, row['back'].strip()),
+            ))
+    return cards
+
+def _order_front_back(image_files):
+    """Sort a directory's two images so the one named 'front' (or first by name) comes first"""
+    return sorted(image_files, key=lambda name: ('front' not in name.lower(), name.lower()))
+
+def scan_directory_tree(root):
+    """Find (insurance_id, insurance_type, front_path, back_path) rows in a directory tree"""
+    cards = []
+    for dir_path, _, file_names in os.walk(root):
+        image_files = [f for f in file_names if f.lower().endswith(IMAGE_EXTENSIONS)]
+        if not image_files:
+            continue
+        if len(image_files) != 2:
+            print(f"Skipping {dir_path}: expected 2 images, found {len(image_files)}")
+            continue
+
+        dir_name = os.path.basename(dir_path)
+        if dir_name.lower() in INSURANCE_TYPES:
+            insurance_id = os.path.basename(os.path.dirname(dir_path))
+            insurance_type = dir_name.lower()
+        else:
+            insurance_id = dir_name
+            insurance_type = 'primary'
+        if not INSURANCE_ID_PATTERN.fullmatch(insurance_id):
+            print(f"Skipping {dir_path}: '{insurance_id}' is not a valid insurance_id")
+            continue
+
+        front, back = _order_front_back(image_files)
+        cards.append((insurance_id, insurance_type, os.path.join(dir_path, front), os.path.join(dir_path, back)))
+
+    cards.sort()
+    return cards
+
+def load_checkpoint(checkpoint_path):
+    """Return the set of (insurance_id, insurance_type) pairs already committed"""
+    done = set()
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                done.add((entry['insurance_id'], entry['insurance_type']))
+    return done
+
+def append_checkpoint(checkpoint_path, rows):
+    """Record committed rows; called only after their DB transaction succeeded"""
+    with open(checkpoint_path, 'a') as f:
+        for insurance_id, s3_url, insurance_type in rows:
+            f.write(json.dumps({"insurance_id": insurance_id, "insurance_type": insurance_type, "link": s3_url}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def build_card_pdf(card):
+    """
+    Worker-process entry point: build one card's PDF.
+
+    Returns:
+        tuple: (card, PDF bytes or None, error message or None)
+    """
+    insurance_id, insurance_type, front_path, back_path = card
+    try:
+        jpeg_images = []
+        for image_path in (front_path, back_path):
+            with open(image_path, 'rb') as f:
+                jpeg_images.append(prepare_image(f.read(), os.path.basename(image_path)))
+        return card, build_pdf(jpeg_images).getvalue(), None
+    except Exception as e:
+        return card, None, str(e)
+
+def run_bulk_ingest(cards, checkpoint_path, workers=None, upload_concurrency=8, batch_size=100):
+    """
+    Process cards with a process pool, upload concurrently and commit in batches.
+
+    Args:
+        cards: List of (insurance_id, insurance_type, front_path, back_path)
+        checkpoint_path: JSONL file of committed cards, used to resume
+        workers: Number of image-processing processes (defaults to CPU count)
+        upload_concurrency: Number of concurrent S3 uploads
+        batch_size: Number of cards per database transaction
+
+    Returns:
+        dict: Counts of processed, skipped and failed cards
+    """
+    validate_configuration()
+
+    done = load_checkpoint(checkpoint_path)
+    pending = [card for card in cards if (card[0], card[1]) not in done]
+    print(f"{len(cards)} cards found, {len(cards) - len(pending)} already ingested, {len(pending)} to process")
+
+    stats = {"processed": 0, "skipped": len(cards) - len(pending), "failed": 0}
+    batch = []
+    in_flight = {}
+
+    def commit_rows(rows):
+        """Commit rows in one transaction and checkpoint them, falling back to one per card"""
+        try:
+            update_insurance_cards_in_db(rows)
+        except Exception as e:
+            if len(rows) > 1:
+                # Like DbWriteBatcher: retry one transaction per card so a bad
+                # row does not keep the rest of the batch out of the checkpoint
+                print(f"Database batch of {len(rows)} cards failed, retrying individually: {e}")
+                for row in rows:
+                    commit_rows([row])
+            else:
+                insurance_id, _, insurance_type = rows[0]
+                print(f"Database update failed for insurance_id {insurance_id} ({insurance_type}), will retry on next run: {e}")
+                stats["failed"] += 1
+            return
+        append_checkpoint(checkpoint_path, rows)
+        stats["processed"] += len(rows)
+
+    def flush_batch():
+        if batch:
+            commit_rows(list(batch))
+            batch.clear()
+
+    def collect(done_uploads):
+        for future in done_uploads:
+            insurance_id, insurance_type = in_flight.pop(future)
+            try:
+                batch.append((insurance_id, future.result(), insurance_type))
+            except Exception as e:
+                print(f"Upload failed for insurance_id {insurance_id} ({insurance_type}): {e}")
+                stats["failed"] += 1
+            if len(batch) >= batch_size:
+                flush_batch()
+
+    # Every card between submission and a finished upload may hold its PDF
+    # in this process (a pool result waiting to be read, or an upload), so
+    # only this many are submitted at once; a slow S3 then stalls the workers
+    # instead of piling up PDFs
+    max_outstanding = (workers or os.cpu_count() or 1) * 2 + upload_concurrency * 2
+    built = queue.Queue()
+    building = 0
+    cards_left = iter(pending)
+
+    # Spawned workers avoid inheriting the parent's S3/DB client threads
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers) as process_pool, \
+            ThreadPoolExecutor(max_workers=upload_concurrency) as upload_pool:
+        while True:
+            while building + len(in_flight) < max_outstanding:
+                card = next(cards_left, None)
+                if card is None:
+                    break
+                process_pool.apply_async(build_card_pdf, (card,), callback=built.put,
+                                         error_callback=lambda e, card=card: built.put((card, None, str(e))))
+                building += 1
+
+            if not building:
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+                continue
+
+            card, pdf_data, error = built.get()
+            building -= 1
+            insurance_id, insurance_type = card[0], card[1]
+            if error:
+                print(f"Processing failed for insurance_id {insurance_id} ({insurance_type}): {error}")
+                stats["failed"] += 1
+            else:
+                future = upload_pool.submit(upload_to_s3, pdf_data, f"{insurance_id}_{insurance_type}.pdf")
+                in_flight[future] = (insurance_id, insurance_type)
+            collect([future for future in in_flight if future.done()])
+
+    flush_batch()
+    print(f"Bulk ingest finished: {stats['processed']} processed, {stats['skipped']} skipped, {stats['failed']} failed")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest scanned insurance cards into S3 and the database.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="CSV with columns insurance_id,type,front,back")
+    source.add_argument('--root', help="Directory tree of <insurance_id>[/<type>]/ folders holding front and back images")
+    parser.add_argument('--checkpoint', default='bulk_ingest_checkpoint.jsonl', help="Checkpoint file used to resume")
+    parser.add_argument('--workers', type=int, default=None, help="Image-processing processes (default: CPU count)")
+    parser.add_argument('--upload-concurrency', type=int, default=8, help="Concurrent S3 uploads")
+    parser.add_argument('--batch-size', type=int, default=100, help="Cards per database transaction")
+    args = parser.parse_args()
+
+    cards = read_manifest(args.manifest) if args.manifest else scan_directory_tree(args.root)
+    stats = run_bulk_ingest(cards, args.checkpoint, args.workers, args.upload_concurrency, args.batch_size)
+    if stats["failed"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
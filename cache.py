@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def sqlite_connection(local, path, setup=None):
+    """
+    This thread's connection to the SQLite file at path, kept on local (a
+    threading.local). The file runs in WAL mode so several processes can
+    read it while another writes; setup(connection) runs once for each new
+    connection.
+    """
+    connection = getattr(local, 'connection', None)
+    if connection is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if setup is not None:
+            setup(connection)
+        local.connection = connection
+    return connection
+
+class ContentCache:
+    """
+    Content-addressed string cache: a bounded in-memory LRU, optionally backed
+    by a SQLite file so entries survive restarts.
+
+    Keys are expected to be content hashes, so entries never go stale and
+    are only dropped to stay within max_entries (memory) or max_bytes (disk,
+    least recently used first). The SQLite file runs in WAL mode so several
+    processes can read it while another writes.
+    """
+
+    def __init__(self, max_entries=1024, sqlite_path=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if sqlite_path:
+            with self._connection() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    " key TEXT PRIMARY KEY,"
+                    " value TEXT NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " last_used REAL NOT NULL)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+                # Running total of entry sizes, kept by triggers so every
+                # process sees it without summing the table
+                connection.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL)")
+                connection.execute("INSERT OR IGNORE INTO cache_size (id, total) SELECT 1, COALESCE(SUM(size), 0) FROM cache")
+                connection.execute(
+                    "CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache"
+                    " BEGIN UPDATE cache_size SET total = total + new.size; END"
+                )
+                connection.execute(
+                    "CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache"
+                    " BEGIN UPDATE cache_size SET total = total - old.size + new.size; END"
+                )
+                connection.execute(
+                    "CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache"
+                    " BEGIN UPDATE cache_size SET total = total - old.size; END"
+                )
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+        return sqlite_connection(self._local, self.sqlite_path)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if not self.sqlite_path:
+            return None
+        connection = self._connection()
+        row = connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.max_bytes:
+            # Recency only matters when entries can be evicted
+            with connection:
+                connection.execute("UPDATE cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._remember(key, row[0])
+        return row[0]
+
+    def set(self, key, value):
+        """Store value under key in memory and, if configured, on disk"""
+        self._remember(key, value)
+        if not self.sqlite_path:
+            return
+        now = time.time()
+        with self._connection() as connection:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the size trigger
+            connection.execute(
+                "INSERT INTO cache (key, value, created_at, size, last_used) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, created_at = excluded.created_at,"
+                " size = excluded.size, last_used = excluded.last_used",
+                (key, value, now, len(value.encode()), now)
+            )
+            if self.max_bytes:
+                self._evict_over_budget(connection)
+
+    def _evict_over_budget(self, connection):
+        """Drop least recently used entries until the file is within max_bytes"""
+        excess = connection.execute("SELECT total FROM cache_size").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        # Walks the last_used index from the oldest entry; stops once enough is freed
+        for key, size in connection.execute("SELECT key, size FROM cache ORDER BY last_used"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM cache WHERE key = ?", evicted)
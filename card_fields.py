@@ -0,0 +1,161 @@
+"""
+Local, deterministic extraction of insurance card fields from OCR text.
+
+Most payer cards follow a handful of layouts ("Member ID: ...", "Group #
+...", "Name ..."), so precompiled patterns plus a payer-name index recover
+the key fields without a network call. Every field comes with a confidence
+score, so callers can fall back to the LLM only for the uncertain ones.
+"""
+import re
+
+INSURANCE_COMPANY = "Insurance Company Name"
+FIRST_NAME = "Patient First Name"
+LAST_NAME = "Patient Last Name"
+MEMBER_ID = "Member ID"
+GROUP_NUMBER = "Group ID/ Group Number"
+INSURANCE_PLAN = "Insurance Plan"
+
+FIELDS = (INSURANCE_COMPANY, FIRST_NAME, LAST_NAME, MEMBER_ID, GROUP_NUMBER, INSURANCE_PLAN)
+
+# Canonical payer name -> aliases as they appear on cards (matched case-insensitively)
+PAYERS = {
+    "UnitedHealthcare": ("unitedhealthcare", "united healthcare", "united health care", "uhc"),
+    "Aetna": ("aetna",),
+    "Cigna": ("cigna",),
+    "Humana": ("humana",),
+    "Blue Cross Blue Shield": ("blue cross blue shield", "bluecross blueshield", "blue cross", "blue shield", "bcbs"),
+    "Anthem": ("anthem",),
+    "Florida Blue": ("florida blue",),
+    "Independence Blue Cross": ("independence blue cross", "ibx"),
+    "Highmark": ("highmark",),
+    "CareFirst": ("carefirst",),
+    "Horizon": ("horizon bcbsnj", "horizon blue cross"),
+    "Premera": ("premera",),
+    "Regence": ("regence",),
+    "Kaiser Permanente": ("kaiser permanente", "kaiser"),
+    "Medicare": ("medicare",),
+    "Medicaid": ("medicaid",),
+    "Tricare": ("tricare",),
+    "Molina Healthcare": ("molina healthcare", "molina"),
+    "Ambetter": ("ambetter",),
+    "WellCare": ("wellcare",),
+    "Oscar Health": ("oscar health", "oscar"),
+    "Health Net": ("health net", "healthnet"),
+    "EmblemHealth": ("emblemhealth", "emblem health"),
+    "Oxford Health Plans": ("oxford health plans", "oxford"),
+    "UMR": ("umr",),
+    "Meritain Health": ("meritain health", "meritain"),
+    "Harvard Pilgrim": ("harvard pilgrim",),
+    "Tufts Health Plan": ("tufts health plan", "tufts"),
+    "Geisinger Health Plan": ("geisinger",),
+    "Priority Health": ("priority health",),
+    "Amerigroup": ("amerigroup",),
+    "CareSource": ("caresource",),
+    "Medical Mutual": ("medical mutual",),
+    "GEHA": ("geha",),
+}
+
+# Aliases that are also ordinary words, names or places ("Oscar Martinez",
+# "Oxford, MS"); on their own they only suggest the payer
+_COMMON_WORD_ALIASES = {"oscar", "oxford", "kaiser", "tufts", "molina", "anthem"}
+
+# Alias -> canonical name, and one alternation over all aliases (longest first,
+# so "blue cross blue shield" wins over "blue cross")
+_PAYER_INDEX = {alias: payer for payer, aliases in PAYERS.items() for alias in aliases}
+_PAYER_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(alias) for alias in sorted(_PAYER_INDEX, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+# (pattern, confidence) pairs, most specific first; group 1 is the value.
+# Labelled matches score 0.9 or more; bare labels that only usually mean the
+# field ("ID:", "Group:", "Name:") score lower, so the LLM confirms them.
+_ID_VALUE = r"([A-Z0-9][A-Z0-9-]{3,24})"
+# A bare label must be the first word of its label, so "ID:" does not match
+# "Group ID:", "Payer ID:" or "Rx ID:", nor "Name:" match "Plan Name:"
+_LABEL_START = r"(?:^|(?<=[^A-Za-z \t]))[ \t]*"
+_MEMBER_ID_PATTERNS = (
+    (re.compile(r"\b(?:member|subscriber|enrollee|identification)\s*(?:id|#|no\.?|number)\s*[:#]?\s*" + _ID_VALUE, re.IGNORECASE), 0.95),
+    (re.compile(_LABEL_START + r"ID\s*(?:#|no\.?|number)?\s*[:#]\s*" + _ID_VALUE, re.IGNORECASE | re.MULTILINE), 0.85),
+    (re.compile(r"^\s*ID\s+" + _ID_VALUE + r"\s*$", re.IGNORECASE | re.MULTILINE), 0.8),
+)
+_GROUP_PATTERNS = (
+    (re.compile(r"\bgroup\s*(?:id|#|no\.?|number)\s*[:#]?\s*" + _ID_VALUE, re.IGNORECASE), 0.95),
+    (re.compile(r"\b(?:group|grp)\s*[:#]?\s*" + _ID_VALUE, re.IGNORECASE), 0.85),
+)
+_NAME_WORD = r"[A-Z][A-Za-z'\-]+"
+_NAME_PATTERNS = (
+    # "Member Name: JANE Q DOE" / "Subscriber: Jane Doe"
+    (re.compile(r"\b(?i:member|subscriber|patient|enrollee)[ \t]*(?i:name)?[ \t]*:[ \t]*(" + _NAME_WORD + r"(?:[ \t]+[A-Z]\.?)?(?:[ \t]+" + _NAME_WORD + r")+)"), 0.9),
+    # "Name: DOE, JANE"
+    (re.compile(_LABEL_START + r"(?i:name)[ \t]*:?[ \t]*(" + _NAME_WORD + r",[ \t]*" + _NAME_WORD + r")", re.MULTILINE), 0.9),
+    (re.compile(_LABEL_START + r"(?i:name)[ \t]*:?[ \t]*(" + _NAME_WORD + r"(?:[ \t]+[A-Z]\.?)?(?:[ \t]+" + _NAME_WORD + r")+)", re.MULTILINE), 0.7),
+)
+_PLAN_PATTERNS = (
+    # "Plan: Choice Plus PPO" / "Plan Name: Open Access"
+    (re.compile(_LABEL_START + r"plan(?:[ \t]+(?:name|type))?[ \t]*:[ \t]*(\S[^\n]{1,59})", re.IGNORECASE | re.MULTILINE), 0.9),
+)
+
+def _first_match(patterns, text, require_digit=False):
+    for pattern, confidence in patterns:
+        for match in pattern.finditer(text):
+            value = match.group(1).strip()
+            if require_digit and not any(c.isdigit() for c in value):
+                continue
+            return value, confidence
+    return None
+
+def _split_name(full_name):
+    """Return (first, last) from "First M Last" or "Last, First" """
+    if "," in full_name:
+        last, first = [part.strip() for part in full_name.split(",", 1)]
+        return first.split()[0], last
+    parts = full_name.split()
+    return parts[0], parts[-1]
+
+def extract_fields(text):
+    """
+    Extract card fields from OCR text.
+
+    Returns:
+        dict: field name -> (value, confidence between 0 and 1) for each field found
+    """
+    fields = {}
+
+    payer_counts, weak_payer_counts = {}, {}
+    for match in _PAYER_PATTERN.finditer(text):
+        alias = match.group(1).lower()
+        counts = weak_payer_counts if alias in _COMMON_WORD_ALIASES else payer_counts
+        payer = _PAYER_INDEX[alias]
+        counts[payer] = counts.get(payer, 0) + 1
+    if payer_counts:
+        payer = max(payer_counts, key=payer_counts.get)
+        # Several different payers named on one card (e.g. network logos) is ambiguous
+        fields[INSURANCE_COMPANY] = (payer, 0.95 if len(payer_counts) == 1 else 0.6)
+    elif weak_payer_counts:
+        # Only common-word aliases: likely a name or address, let the LLM decide
+        fields[INSURANCE_COMPANY] = (max(weak_payer_counts, key=weak_payer_counts.get), 0.5)
+
+    member_id = _first_match(_MEMBER_ID_PATTERNS, text, require_digit=True)
+    if member_id:
+        fields[MEMBER_ID] = member_id
+
+    group_number = _first_match(_GROUP_PATTERNS, text, require_digit=True)
+    if group_number:
+        fields[GROUP_NUMBER] = group_number
+
+    name = _first_match(_NAME_PATTERNS, text)
+    if name:
+        first_name, last_name = _split_name(name[0])
+        fields[FIRST_NAME] = (first_name, name[1])
+        fields[LAST_NAME] = (last_name, name[1])
+
+    plan = _first_match(_PLAN_PATTERNS, text)
+    if plan:
+        fields[INSURANCE_PLAN] = plan
+
+    return fields
+
+def format_fields(values):
+    """Render {field: value} as the "Key: value" lines the LLM produces"""
+    return "\n".join(f"{field}: {values[field]}" for field in FIELDS if field in values)
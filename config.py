@@ -0,0 +1,56 @@
+"""
+Service settings, read from the environment on first use.
+
+Importing a module that uses `config` has no side effects: .env is only
+read the first time a setting is looked up (or an entry point calls
+load_env()), and credentials are never copied into module globals.
+
+Tuning knobs (sizes, pool limits, ...) are still plain module constants read
+when their module is imported, so entry points (app.py, serve.py,
+bulk_ingest.py, scan.py run as a script) call load_env() before importing
+the pipeline to let .env set those too.
+"""
+import os
+import threading
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+def load_env():
+    """Read .env into os.environ once; variables already set in the environment win"""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+class Config:
+    """
+    Environment-backed settings with defaults; attribute names are the
+    environment variable names, e.g. config.S3_BUCKET.
+
+    Values are looked up on every access (after .env has been loaded once),
+    so changes to os.environ are always seen.
+    """
+
+    def __init__(self, defaults):
+        self._defaults = defaults
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._defaults:
+            raise AttributeError(f"Unknown setting: {name}")
+        load_env()
+        return os.getenv(name, self._defaults[name])
+
+config = Config({
+    # AWS S3
+    "AWS_ACCESS_KEY_ID": None,
+    "AWS_SECRET_ACCESS_KEY": None,
+    "AWS_REGION": None,
+    "S3_BUCKET": None,
+    # OpenAI, Document AI and Google Drive (scan.py)
+    "OPENAI_API_KEY": None,
+    "FOLDER_ID": None,
+    "GOOGLE_APPLICATION_CREDENTIALS": "credentials.json",
+})
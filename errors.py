@@ -0,0 +1,18 @@
+"""
+Errors that end a request with a specific HTTP status.
+
+app.py answers any RequestRejected with {"error": message}, its
+status_code and its headers; subclasses set their default status.
+"""
+
+class RequestRejected(Exception):
+    """A request the service refuses, with a message meant for the client"""
+
+    status_code = 400
+    headers = {}
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from cache import sqlite_connection
+from errors import RequestRejected
+from processing import process_insurance_card_uploads
+
+# Async job settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))                           # Background processing threads
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "16"))                    # Jobs waiting for a thread, per process; more get a 503
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))   # How long finished jobs stay queryable
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3")       # Job state, shared by all server workers on the host
+
+# A job runs in the worker process that accepted it, but its status may be
+# polled through any worker, so job state lives in a SQLite file (WAL mode,
+# one connection per thread) rather than in process memory
+_store_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+# Each waiting job holds its upload bytes (up to ~20MB), so the queue in
+# front of the executor is bounded: running plus queued jobs take a slot
+_job_slots = threading.BoundedSemaphore(JOB_WORKERS + JOB_MAX_QUEUED)
+
+class JobQueueFull(RequestRejected):
+    """Too many async jobs are already queued in this process"""
+
+    status_code = 503
+    headers = {'Retry-After': '5'}
+
+def get_executor():
+    """Return the process-wide worker pool used for background uploads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="upload-job")
+        return _executor
+
+def reset_after_fork():
+    """Drop store connections and worker threads inherited from a parent process"""
+    global _store_local, _executor, _executor_lock, _job_slots
+    _store_local = threading.local()
+    _executor, _executor_lock = None, threading.Lock()
+    _job_slots = threading.BoundedSemaphore(JOB_WORKERS + JOB_MAX_QUEUED)
+
+def shutdown():
+    """Stop accepting jobs and wait for queued and running ones to finish"""
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+
+def _create_jobs_table(connection):
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " finished_at REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+
+def _connection():
+    """This thread's connection to the job store, creating the table on first use"""
+    return sqlite_connection(_store_local, JOB_STORE_PATH, setup=_create_jobs_table)
+
+def _prune_finished_jobs(connection):
+    """Drop finished jobs older than JOB_RETENTION_SECONDS"""
+    connection.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - JOB_RETENTION_SECONDS,))
+
+def _save_job(connection, job):
+    connection.execute(
+        "INSERT OR REPLACE INTO jobs (job_id, state, finished_at) VALUES (?, ?, ?)",
+        (job['job_id'], json.dumps(job), job['finished_at'])
+    )
+
+def _update_job(job_id, **fields):
+    # Only the worker running a job writes it, so read-modify-write is safe
+    job = get_job(job_id)
+    job.update(fields)
+    with _connection() as connection:
+        _save_job(connection, job)
+
+def _run_job(job_id, uploads, insurance_id, insurance_type):
+    """Worker entry point: run the upload pipeline and record the outcome"""
+    # Everything, including job store writes, runs inside the try: the
+    # executor would swallow an exception and the slot would never be freed
+    try:
+        _update_job(job_id, status='running', started_at=time.time())
+        result = process_insurance_card_uploads(uploads, insurance_id, insurance_type)
+        _update_job(job_id, status='succeeded', link=result["link"], derivatives=result["derivatives"],
+                    finished_at=time.time())
+        print(f"Job {job_id} succeeded: {result['link']}")
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        try:
+            _update_job(job_id, status='failed', error=str(e), finished_at=time.time())
+        except Exception as store_error:
+            print(f"Could not record the failure of job {job_id}: {store_error}")
+    finally:
+        _job_slots.release()
+
+def submit_job(uploads, insurance_id=None, insurance_type='primary'):
+    """
+    Queue insurance card uploads for background processing.
+
+    Args:
+        uploads: List of (file_name, image_bytes) tuples in upload order
+        insurance_id: Optional insurance ID for database update
+        insurance_type: Type of insurance ('primary' or 'secondary')
+
+    Returns:
+        str: ID of the queued job
+
+    Raises:
+        JobQueueFull: JOB_MAX_QUEUED jobs are already waiting for a worker thread
+    """
+    if not _job_slots.acquire(blocking=False):
+        raise JobQueueFull("The server is busy processing other uploads. Please try again shortly.")
+
+    try:
+        job_id = str(uuid.uuid4())
+        with _connection() as connection:
+            _prune_finished_jobs(connection)
+            _save_job(connection, {
+                "job_id": job_id,
+                "status": "queued",
+                "insurance_id": insurance_id,
+                "insurance_type": insurance_type,
+                "link": None,
+                "derivatives": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            })
+        get_executor().submit(_run_job, job_id, uploads, insurance_id, insurance_type)
+    except Exception:
+        _job_slots.release()
+        raise
+
+    print(f"Queued job {job_id} for insurance_id: {insurance_id}, type: {insurance_type}")
+    return job_id
+
+def get_job(job_id):
+    """Return a snapshot of the job's state, or None if it is unknown or expired"""
+    row = _connection().execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
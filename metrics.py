@@ -0,0 +1,188 @@
+"""
+In-process instrumentation for the card pipeline.
+
+Counters and histograms are rendered in the Prometheus text format for the
+/metrics endpoint. time_stage() additionally records each stage into the
+current request's RequestTimings, which app.py sends back as a
+Server-Timing header. The timings live in a context variable, so work
+handed to a thread pool must be wrapped with propagate_context() to be
+attributed to the request that submitted it.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a fast rotate through a slow S3 upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        """Exposition lines for this counter"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Distribution of observed values in fixed cumulative buckets, optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def collect(self):
+        """Exposition lines for this histogram"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+# Pipeline metrics
+STAGE_SECONDS = Histogram("card_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("card_stage_errors_total", "Pipeline stages that raised an exception.", ["stage"])
+JPEG_ENCODE_PASSES = Histogram("card_jpeg_encode_passes", "JPEG encodes needed to meet the size budget.",
+                               buckets=(1, 2, 3, 4, 5, 6, 8))
+JPEG_PASSTHROUGH = Counter("card_jpeg_passthrough_total", "Uploaded JPEGs used as PDF pages without re-encoding.")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.", ["method", "endpoint", "status"])
+
+class RequestTimings:
+    """Per-request stage durations, summed when a stage runs more than once (e.g. front and back)"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, count + 1)
+
+    def server_timing(self):
+        """Server-Timing header value, in milliseconds, with the request total last"""
+        with self._lock:
+            stages = list(self._stages.items())
+        entries = []
+        for stage, (total, count) in stages:
+            entry = f"{stage};dur={total * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="{count}x"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started_at) * 1000:.1f}")
+        return ", ".join(entries)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def start_request_timings():
+    """Begin collecting stage timings for the request running in the current context"""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+def current_request_timings():
+    """The RequestTimings of the current request, or None outside one"""
+    return _request_timings.get()
+
+@contextmanager
+def time_stage(stage):
+    """Time a pipeline stage into STAGE_SECONDS (and STAGE_ERRORS if it raises) and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+def propagate_context(func):
+    """
+    Wrap func so it runs in a copy of the caller's context, e.g. on a thread pool.
+
+    Each call gets its own copy, since one Context cannot be entered by two
+    threads at once (executor.map runs the same wrapper concurrently).
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
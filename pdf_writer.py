@@ -0,0 +1,160 @@
+"""
+Minimal PDF writer that embeds JPEG data as-is.
+
+Each page holds one image XObject with the /DCTDecode filter, so the
+compressed JPEG bytes go into the file untouched: no decode, no re-encode,
+and the PDF size is the sum of the JPEG sizes plus a few hundred bytes.
+"""
+from io import BytesIO
+
+POINTS_PER_INCH = 72
+
+# Named page sizes in points (portrait); None means "size the page to the image"
+PAGE_SIZES = {
+    "image": None,
+    "card": (153, 243),      # ID-1 / CR80 card, 2.125in x 3.375in
+    "letter": (612, 792),
+    "a4": (595, 842),
+}
+
+# SOF markers carry the frame header; C4 (DHT), C8 (JPG) and CC (DAC) share the range but are not frames
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_COLOR_SPACES = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}
+
+def read_jpeg_header(jpeg_data):
+    """
+    Read (width, height, components) from a JPEG's frame header without decoding it.
+
+    Raises:
+        ValueError: If the data is not a baseline or progressive JPEG
+    """
+    if not jpeg_data.startswith(b'\xff\xd8'):
+        raise ValueError("Not a JPEG image")
+
+    position = 2
+    length = len(jpeg_data)
+    while position + 4 <= length:
+        if jpeg_data[position] != 0xFF:
+            raise ValueError("Corrupt JPEG marker stream")
+        marker = jpeg_data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            position += 2
+            continue
+        segment_length = int.from_bytes(jpeg_data[position + 2:position + 4], 'big')
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(jpeg_data[position + 5:position + 7], 'big')
+            width = int.from_bytes(jpeg_data[position + 7:position + 9], 'big')
+            components = jpeg_data[position + 9]
+            return width, height, components
+        if marker == 0xDA:
+            break
+        position += 2 + segment_length
+
+    raise ValueError("JPEG frame header not found")
+
+def _page_layout(image_width, image_height, page_size, resolution):
+    """Return (page_width, page_height, draw_x, draw_y, draw_width, draw_height) in points"""
+    natural_width = image_width * POINTS_PER_INCH / resolution
+    natural_height = image_height * POINTS_PER_INCH / resolution
+    if page_size is None:
+        return natural_width, natural_height, 0, 0, natural_width, natural_height
+
+    page_width, page_height = page_size
+    # Turn the page to match the image orientation
+    if (image_width > image_height) != (page_width > page_height):
+        page_width, page_height = page_height, page_width
+
+    scale = min(page_width / image_width, page_height / image_height)
+    draw_width = image_width * scale
+    draw_height = image_height * scale
+    return (page_width, page_height,
+            (page_width - draw_width) / 2, (page_height - draw_height) / 2,
+            draw_width, draw_height)
+
+def _number(value):
+    """Format a coordinate compactly (PDF accepts plain decimals)"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+def write_jpeg_pdf(jpeg_pages, page_size="image", resolution=POINTS_PER_INCH):
+    """
+    Build a PDF with one JPEG per page, embedding the JPEG bytes unchanged.
+
+    Args:
+        jpeg_pages: List of JPEG bytes, one per page, in order
+        page_size: A PAGE_SIZES name, or a (width, height) tuple in points
+        resolution: Pixels per inch when page_size is "image"
+
+    Returns:
+        bytes: The PDF file
+    """
+    if isinstance(page_size, str):
+        if page_size not in PAGE_SIZES:
+            raise ValueError(f"Unknown PDF page size: {page_size}")
+        page_size = PAGE_SIZES[page_size]
+
+    output = BytesIO()
+    offsets = []
+
+    def start_object():
+        offsets.append(output.tell())
+        output.write(f"{len(offsets)} 0 obj\n".encode())
+
+    output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    # Objects 1 and 2 are the catalog and page tree; each page then uses three
+    # objects (page, content stream, image), numbered in that order
+    page_ids = [3 + index * 3 for index in range(len(jpeg_pages))]
+
+    start_object()
+    output.write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    start_object()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    output.write(f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>\nendobj\n".encode())
+
+    for page_id, jpeg_data in zip(page_ids, jpeg_pages):
+        width, height, components = read_jpeg_header(jpeg_data)
+        if components not in _COLOR_SPACES:
+            raise ValueError(f"Unsupported JPEG with {components} components")
+        page_width, page_height, x, y, draw_width, draw_height = _page_layout(width, height, page_size, resolution)
+
+        start_object()
+        output.write((
+            f"<< /Type /Page /Parent 2 0 R "
+            f"/MediaBox [0 0 {_number(page_width)} {_number(page_height)}] "
+            f"/Resources << /XObject << /Im0 {page_id + 2} 0 R >> >> "
+            f"/Contents {page_id + 1} 0 R >>\nendobj\n"
+        ).encode())
+
+        content = (
+            f"q {_number(draw_width)} 0 0 {_number(draw_height)} {_number(x)} {_number(y)} cm /Im0 Do Q"
+        ).encode()
+        start_object()
+        output.write(f"<< /Length {len(content)} >>\nstream\n".encode())
+        output.write(content)
+        output.write(b"\nendstream\nendobj\n")
+
+        # Adobe CMYK JPEGs store inverted values
+        decode = " /Decode [1 0 1 0 1 0 1 0]" if components == 4 else ""
+        start_object()
+        output.write((
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {_COLOR_SPACES[components]} /BitsPerComponent 8{decode} "
+            f"/Filter /DCTDecode /Length {len(jpeg_data)} >>\nstream\n"
+        ).encode())
+        output.write(jpeg_data)
+        output.write(b"\nendstream\nendobj\n")
+
+    xref_offset = output.tell()
+    output.write(f"xref\n0 {len(offsets) + 1}\n".encode())
+    output.write(b"0000000000 65535 f \n")
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write((
+        f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode())
+    return output.getvalue()
@@ -1,82 +1,292 @@
 import os
 import shutil
 import uuid
+import hashlib
 import json
-from dotenv import load_dotenv
-from PIL import Image, ExifTags
-import boto3
-import psycopg2
+import math
+import threading
+import time
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from PIL import Image, ImageOps, features
 from datetime import datetime
+from cache import ContentCache
+from config import config
+from errors import RequestRejected
+from pdf_writer import write_jpeg_pdf
+from metrics import time_stage, propagate_context, JPEG_ENCODE_PASSES, JPEG_PASSTHROUGH
 
-load_dotenv()
-
-# AWS S3 Configuration
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION")
-S3_BUCKET = os.getenv("S3_BUCKET")
+# AWS credentials and the bucket come from config (read on first use);
+# boto3 and psycopg2 are imported by the functions that need them, so
+# importing this module stays cheap for code paths that never touch S3 or the DB
 
 # Image compression settings
 MAX_FILE_SIZE_MB = 2  # Target max file size in MB
 MAX_DIMENSION = 2000  # Max width or height in pixels
 JPEG_QUALITY = 85     # JPEG quality (1-100, higher = better quality)
+MIN_JPEG_QUALITY = 30   # Lowest quality the size search may fall back to
+MAX_ENCODE_PASSES = 5   # Upper bound on full JPEG encodes per image
+RESIZE_FILTER = os.getenv("RESIZE_FILTER", "BICUBIC")  # Pillow resampling filter for downscaling (e.g. BILINEAR, BICUBIC, LANCZOS)
+
+# Decode memory limits, checked from the image header before any pixels are decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))        # Per image, after JPEG draft downscaling
+IMAGE_MEMORY_BUDGET_MB = int(os.getenv("IMAGE_MEMORY_BUDGET_MB", "512"))      # Decoded pixels held at once per process
+IMAGE_MEMORY_WAIT_SECONDS = float(os.getenv("IMAGE_MEMORY_WAIT_SECONDS", "30"))  # Wait for budget before answering 503
+DECODE_BYTES_PER_PIXEL = 4   # Pillow stores RGB(A)/CMYK pixels in 32 bits
+DECODE_WORKING_COPIES = 2    # The decoded image plus one full-size conversion
+
+_memory_budget = None
+_memory_budget_lock = threading.Lock()
+
+# PDF page settings: "image" sizes each page to its photo, or use "card", "letter", "a4"
+PDF_PAGE_SIZE = os.getenv("PDF_PAGE_SIZE", "image")
+PDF_RESOLUTION = int(os.getenv("PDF_RESOLUTION", "72"))  # Pixels per inch for "image" pages
+
+# Derivatives made from the same decoded images as the PDF pages
+CARD_SIDES = ("front", "back")
+THUMBNAIL_MAX_DIMENSION = int(os.getenv("THUMBNAIL_MAX_DIMENSION", "320"))  # Dashboard preview size in pixels
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP")                     # WEBP, or JPEG (also used when Pillow lacks WebP)
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "90"))                  # Grayscale OCR variant
+OCR_AUTOCONTRAST_CUTOFF = float(os.getenv("OCR_AUTOCONTRAST_CUTOFF", "1"))   # Percent of darkest/lightest pixels clipped
+
+# EXIF orientation tag and the transpose that brings each value upright
+EXIF_ORIENTATION_TAG = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# S3 client and transfer settings
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20"))      # Shared HTTP connections
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))  # Switch to multipart above this
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8"))  # Size of each multipart part
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "4"))                # Parallel part uploads
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+# Duplicate-upload cache (hash of both images + processing settings -> S3 links)
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "1024"))  # In-memory LRU entries
+DEDUP_CACHE_PATH = os.getenv("DEDUP_CACHE_PATH")                 # Optional SQLite file that survives restarts
+
+_dedup_cache = None
+_dedup_cache_lock = threading.Lock()
+
+# Pipeline concurrency (per-image work and S3 uploads overlapping DB writes)
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+_pipeline_executor = None
+_pipeline_executor_lock = threading.Lock()
+
+# Database connection pool settings
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))                 # Connections opened up front
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))                # Hard cap per process
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))      # Seconds to wait for a free connection
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # Ping connections idle longer than this
+
+_db_credentials = None
+_db_pool = None
+_db_pool_slots = None
+_db_pool_lock = threading.Lock()
+_db_last_used = {}
+
+# Write-behind batching of card updates and interaction inserts
+DB_WRITE_BATCHING = os.getenv("DB_WRITE_BATCHING", "false").lower() in ('1', 'true', 'yes')
+DB_BATCH_MAX_ROWS = int(os.getenv("DB_BATCH_MAX_ROWS", "200"))        # Flush once this many writes are queued
+DB_BATCH_MAX_DELAY = float(os.getenv("DB_BATCH_MAX_DELAY", "0.05"))  # ...or this many seconds after the first
+
+_db_batcher = None
+_db_batcher_lock = threading.Lock()
+
+class ImageRejected(RequestRejected):
+    """An image the pipeline will not decode: over the pixel budget (413) or no memory budget free in time (503)"""
+    
+    status_code = 413
+
+class MemoryBudget:
+    """
+    Bytes of decoded image data that may be held at once in this process.
+    
+    reserve() blocks until the requested bytes are free, so large images
+    queue behind each other instead of all decoding at the same time. A
+    request larger than the whole budget is clamped to it and runs alone.
+    """
+    
+    def __init__(self, total_bytes, timeout=None):
+        self.total_bytes = total_bytes
+        self.timeout = timeout
+        self._available = total_bytes
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def reserve(self, nbytes):
+        nbytes = min(nbytes, self.total_bytes)
+        with time_stage("memory_wait"), self._condition:
+            if not self._condition.wait_for(lambda: self._available >= nbytes, timeout=self.timeout):
+                raise ImageRejected("Server is busy processing other large images. Please try again shortly.", 503)
+            self._available -= nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._available += nbytes
+                self._condition.notify_all()
+
+def get_memory_budget():
+    """Return the process-wide MemoryBudget for image decoding"""
+    global _memory_budget
+    with _memory_budget_lock:
+        if _memory_budget is None:
+            _memory_budget = MemoryBudget(IMAGE_MEMORY_BUDGET_MB * 1024 * 1024, IMAGE_MEMORY_WAIT_SECONDS)
+        return _memory_budget
 
 def load_db_credentials():
-    """Load database credentials from game_db_credentials.json"""
-    with open('game_db_credentials.json', 'r') as f:
-        return json.load(f)
+    """Load database credentials from game_db_credentials.json (read once per process)"""
+    global _db_credentials
+    if _db_credentials is None:
+        with open('game_db_credentials.json', 'r') as f:
+            _db_credentials = json.load(f)
+    return _db_credentials
+
+def get_db_pool():
+    """Return the process-wide PostgreSQL connection pool, creating it on first use"""
+    global _db_pool, _db_pool_slots
+    with _db_pool_lock:
+        if _db_pool is None:
+            from psycopg2 import pool as pg_pool
+            credentials = load_db_credentials()
+            _db_pool = pg_pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                host=credentials['host'],
+                database=credentials['database'],
+                user=credentials['user'],
+                password=credentials['password'],
+                port=credentials.get('port', 5432)
+            )
+            # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead
+            _db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+            print(f"Database connection pool ready (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+        return _db_pool
 
-def get_db_connection():
-    """Create and return a PostgreSQL database connection"""
+def _connection_is_healthy(connection):
+    """Cheap liveness check, with a round-trip ping only for long-idle connections"""
+    import psycopg2
+    from psycopg2 import extensions as pg_extensions
+    if connection.closed:
+        return False
+    if connection.get_transaction_status() != pg_extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    last_used = _db_last_used.get(id(connection))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
     try:
-        credentials = load_db_credentials()
-        connection = psycopg2.connect(
-            host=credentials['host'],
-            database=credentials['database'],
-            user=credentials['user'],
-            password=credentials['password'],
-            port=credentials.get('port', 5432)
-        )
-        return connection
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
-        raise
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
-def insert_interaction_record(s3_url, insurance_type):
-    """Insert a record into the interaction table for insurance card upload tracking"""
+@contextmanager
+def db_connection():
+    """
+    Check out a healthy pooled connection for the duration of a with-block.
+    
+    The connection is rolled back if the block raises and is always returned
+    to the pool, on both success and error paths.
+    """
+    db_pool = get_db_pool()
+    with time_stage("db_pool_wait"):
+        if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise Exception(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a database connection")
+    
+    connection = None
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Insert into interaction table
-        insert_query = """
-            INSERT INTO interaction (channel, timestamp, length, from_id, to_id, attachment, raw_content) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        # Prepare values according to requirements
-        channel = "insurance_card_upload"
-        timestamp = datetime.utcnow()  # Current timestamp
-        length = 0
-        from_id = 417223
-        to_id = None
-        attachment = s3_url
-        raw_content = insurance_type  # "primary" or "secondary"
+        # Replace dead or broken connections transparently
+        with time_stage("db_connect"):
+            for _ in range(DB_POOL_MAX + 1):
+                connection = db_pool.getconn()
+                if _connection_is_healthy(connection):
+                    break
+                print("Discarding unhealthy database connection")
+                _db_last_used.pop(id(connection), None)
+                db_pool.putconn(connection, close=True)
+                connection = None
+            if connection is None:
+                raise Exception("Could not obtain a healthy database connection")
         
-        cursor.execute(insert_query, (channel, timestamp, length, from_id, to_id, attachment, raw_content))
-        connection.commit()
+        try:
+            yield connection
+        except Exception as e:
+            if not connection.closed:
+                connection.rollback()
+                print(f"Database transaction rolled back due to error: {e}")
+            raise
+    finally:
+        if connection is not None:
+            _db_last_used[id(connection)] = time.monotonic()
+            db_pool.putconn(connection, close=bool(connection.closed))
+        _db_pool_slots.release()
+
+def interaction_row(s3_url, insurance_type):
+    """Column values for an interaction record of an insurance card upload"""
+    channel = "insurance_card_upload"
+    timestamp = datetime.utcnow()  # Current timestamp
+    length = 0
+    from_id = 417223
+    to_id = None
+    attachment = s3_url
+    raw_content = insurance_type  # "primary" or "secondary"
+    return (channel, timestamp, length, from_id, to_id, attachment, raw_content)
+
+def insert_interaction_record(s3_url, insurance_type, before_commit=None):
+    """
+    Insert a record into the interaction table for insurance card upload tracking.
+    
+    before_commit, if given, is called after the INSERT runs but before COMMIT;
+    if it raises, the transaction is rolled back. This lets callers run the
+    statement while the S3 upload is still in flight.
+    """
+    try:
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            
+            # Insert into interaction table
+            insert_query = """
+                INSERT INTO interaction (channel, timestamp, length, from_id, to_id, attachment, raw_content) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+            
+            with time_stage("interaction_insert"):
+                cursor.execute(insert_query, interaction_row(s3_url, insurance_type))
+            # Waiting on before_commit (usually the S3 upload) is not DB time
+            if before_commit:
+                before_commit()
+            with time_stage("db_commit"):
+                connection.commit()
+            cursor.close()
         
         print(f"Successfully inserted interaction record for {insurance_type} insurance card upload: {s3_url}")
         
-        cursor.close()
-        connection.close()
-        
     except Exception as e:
         print(f"Error inserting interaction record: {e}")
         raise
 
-def update_insurance_card_in_db(insurance_id, s3_url, insurance_type='primary'):
-    """Update the insurance_fresh table and insert into insurance table with the S3 URL"""
+def update_insurance_card_in_db(insurance_id, s3_url, insurance_type='primary', before_commit=None):
+    """
+    Update the insurance_fresh table and insert into insurance table with the S3 URL.
+    
+    before_commit behaves as in insert_interaction_record.
+    """
     if not insurance_id:
         print("No insurance_id provided, skipping database update")
         return
@@ -85,92 +295,302 @@ def update_insurance_card_in_db(insurance_id, s3_url, insurance_type='primary'):
     column_name = f"{insurance_type}_insurance_card"
     
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Start transaction
-        connection.autocommit = False
-        
-        # 1. Update the appropriate column in insurance_fresh table
-        update_query = f"""
-            UPDATE insurance_fresh 
-            SET {column_name} = %s 
-            WHERE insurance_id = %s
-        """
-        
-        cursor.execute(update_query, (s3_url, insurance_id))
-        
-        if cursor.rowcount > 0:
-            print(f"Successfully updated insurance_fresh table for insurance_id {insurance_id} ({insurance_type})")
-        else:
-            print(f"Warning: No records found in insurance_fresh for insurance_id {insurance_id}")
-        
-        # 2. Insert into insurance table with the appropriate column
-        insert_query = f"""
-            INSERT INTO insurance (insurance_id, {column_name}) 
-            VALUES (%s, %s)
-        """
-        
-        cursor.execute(insert_query, (insurance_id, s3_url))
-        print(f"Successfully inserted/updated insurance table for insurance_id {insurance_id} ({insurance_type})")
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            
+            # 1. Update the appropriate column in insurance_fresh table
+            update_query = f"""
+                UPDATE insurance_fresh 
+                SET {column_name} = %s 
+                WHERE insurance_id = %s
+            """
+            
+            with time_stage("db_update"):
+                cursor.execute(update_query, (s3_url, insurance_id))
+            
+            if cursor.rowcount > 0:
+                print(f"Successfully updated insurance_fresh table for insurance_id {insurance_id} ({insurance_type})")
+            else:
+                print(f"Warning: No records found in insurance_fresh for insurance_id {insurance_id}")
+            
+            # 2. Insert into insurance table with the appropriate column
+            insert_query = f"""
+                INSERT INTO insurance (insurance_id, {column_name}) 
+                VALUES (%s, %s)
+            """
+            
+            with time_stage("db_update"):
+                cursor.execute(insert_query, (insurance_id, s3_url))
+            print(f"Successfully inserted/updated insurance table for insurance_id {insurance_id} ({insurance_type})")
+            
+            # Commit both operations; waiting on before_commit is not DB time
+            if before_commit:
+                before_commit()
+            with time_stage("db_commit"):
+                connection.commit()
+            cursor.close()
         
-        # Commit both operations
-        connection.commit()
         print(f"Database operations completed successfully for insurance_id {insurance_id} with S3 URL: {s3_url} ({insurance_type})")
         
-        cursor.close()
-        connection.close()
-        
     except Exception as e:
-        # Rollback in case of error
-        if connection:
-            connection.rollback()
-            print(f"Database transaction rolled back due to error: {e}")
+        # db_connection() rolls back and returns the connection to the pool
         print(f"Error updating database: {e}")
         raise
 
+def execute_card_updates(cursor, rows):
+    """
+    Run set-based statements for many card updates on an open cursor.
+    
+    The UPDATEs are sent in pages with execute_batch (so insurance_id keeps the
+    same implicit typing as the single-row statement) and the INSERTs as
+    multi-row VALUES lists with execute_values.
+    
+    Args:
+        cursor: Cursor inside the caller's transaction
+        rows: List of (insurance_id, s3_url, insurance_type) tuples
+    """
+    from psycopg2.extras import execute_batch, execute_values
+    # Group by target column; the column name cannot be a query parameter
+    rows_by_column = {}
+    for insurance_id, s3_url, insurance_type in rows:
+        rows_by_column.setdefault(f"{insurance_type}_insurance_card", []).append((insurance_id, s3_url))
+    
+    for column_name, column_rows in rows_by_column.items():
+        execute_batch(
+            cursor,
+            f"UPDATE insurance_fresh SET {column_name} = %s WHERE insurance_id = %s",
+            [(s3_url, insurance_id) for insurance_id, s3_url in column_rows],
+            page_size=DB_BATCH_MAX_ROWS
+        )
+        execute_values(
+            cursor,
+            f"INSERT INTO insurance (insurance_id, {column_name}) VALUES %s",
+            column_rows,
+            page_size=DB_BATCH_MAX_ROWS
+        )
+
+def execute_interaction_inserts(cursor, rows):
+    """Insert many interaction rows (as built by interaction_row) in one statement"""
+    from psycopg2.extras import execute_values
+    execute_values(
+        cursor,
+        "INSERT INTO interaction (channel, timestamp, length, from_id, to_id, attachment, raw_content) VALUES %s",
+        rows,
+        page_size=DB_BATCH_MAX_ROWS
+    )
+
+def update_insurance_cards_in_db(rows):
+    """
+    Apply many insurance card updates in a single transaction.
+    
+    Args:
+        rows: List of (insurance_id, s3_url, insurance_type) tuples
+    """
+    try:
+        with db_connection() as connection, time_stage("db_batch_write"):
+            cursor = connection.cursor()
+            execute_card_updates(cursor, rows)
+            connection.commit()
+            cursor.close()
+        
+        print(f"Database batch committed for {len(rows)} insurance cards")
+        
+    except Exception as e:
+        print(f"Error applying database batch: {e}")
+        raise
+
+class DbWriteBatcher:
+    """
+    Write-behind buffer for card updates and interaction inserts.
+    
+    Writes are queued from any thread and flushed by a background thread
+    once DB_BATCH_MAX_ROWS are waiting or DB_BATCH_MAX_DELAY seconds have
+    passed since the first one, using multi-row statements in a single
+    transaction. Each submit returns a Future that resolves when that row is
+    committed. If a batch fails, its rows are retried one transaction each so
+    a single bad row only fails its own caller.
+    """
+    
+    def __init__(self, max_rows=DB_BATCH_MAX_ROWS, max_delay=DB_BATCH_MAX_DELAY):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-write-batcher", daemon=True)
+        self._thread.start()
+    
+    def submit_card_update(self, insurance_id, s3_url, insurance_type='primary'):
+        """Queue an insurance/insurance_fresh update; returns a Future"""
+        return self._submit('card', (insurance_id, s3_url, insurance_type))
+    
+    def submit_interaction(self, s3_url, insurance_type):
+        """Queue an interaction insert; returns a Future"""
+        return self._submit('interaction', interaction_row(s3_url, insurance_type))
+    
+    def _submit(self, kind, row):
+        if self._closed:
+            raise RuntimeError("DbWriteBatcher is closed")
+        future = Future()
+        self._queue.put((kind, row, future))
+        return future
+    
+    def close(self):
+        """Flush everything still queued and stop the background thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._flush(batch)
+            if stopping:
+                return
+    
+    def _write(self, batch):
+        card_rows = [row for kind, row, _ in batch if kind == 'card']
+        interaction_rows = [row for kind, row, _ in batch if kind == 'interaction']
+        with db_connection() as connection, time_stage("db_batch_write"):
+            cursor = connection.cursor()
+            if card_rows:
+                execute_card_updates(cursor, card_rows)
+            if interaction_rows:
+                execute_interaction_inserts(cursor, interaction_rows)
+            connection.commit()
+            cursor.close()
+    
+    def _flush(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            print(f"Database batch of {len(batch)} writes failed, retrying individually: {e}")
+            for item in batch:
+                self._flush([item])
+            return
+        
+        for _, _, future in batch:
+            future.set_result(True)
+        print(f"Database batch committed: {len(batch)} writes")
+
+def get_db_batcher():
+    """Return the process-wide DbWriteBatcher, starting it on first use"""
+    global _db_batcher
+    with _db_batcher_lock:
+        if _db_batcher is None:
+            _db_batcher = DbWriteBatcher()
+        return _db_batcher
+
 def create_s3_client():
-    """Create and return an S3 client"""
+    """Create and return an S3 client with a tuned keep-alive connection pool"""
+    import boto3
+    from botocore.config import Config as BotoConfig
     return boto3.client(
         's3',
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION
+        aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+        region_name=config.AWS_REGION,
+        config=BotoConfig(
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            retries={'max_attempts': 3, 'mode': 'standard'}
+        )
     )
 
-def upload_to_s3(file_path, file_name):
-    """Upload a file to S3 and return the URL"""
+def get_s3_client():
+    """Return the process-wide S3 client (boto3 clients are thread-safe once built)"""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = create_s3_client()
+        return _s3_client
+
+def new_s3_key(file_name):
+    """Generate a unique S3 key under uploads/, keeping file_name's extension"""
+    file_ext = os.path.splitext(file_name)[1]
+    return f"uploads/{str(uuid.uuid4())}{file_ext}"
+
+def s3_url_for_key(key):
+    """Public URL of an object in the S3 bucket"""
+    return f"https://{config.S3_BUCKET}.s3.{config.AWS_REGION}.amazonaws.com/{key}"
+
+def upload_to_s3(source, file_name, content_type='application/pdf',
+                 multipart_threshold_mb=S3_MULTIPART_THRESHOLD_MB, max_concurrency=S3_MAX_CONCURRENCY, key=None):
+    """
+    Upload data to S3 under a new unique key and return the URL.
+    
+    Args:
+        source: File path, bytes, or a readable file-like object
+        file_name: Original file name (its extension is kept on the S3 key)
+        content_type: Content-Type stored with the object
+        multipart_threshold_mb: Use multipart uploads for objects larger than this
+        max_concurrency: Number of parts uploaded in parallel
+        key: S3 key to use; a new unique key is generated when omitted
+    
+    Returns:
+        str: S3 URL of the uploaded object
+    """
     try:
-        s3_client = create_s3_client()
+        with time_stage("s3_upload"):
+            from boto3.s3.transfer import TransferConfig
+            s3_client = get_s3_client()
+            bucket = config.S3_BUCKET
         
-        # Generate unique key for S3
-        file_ext = os.path.splitext(file_name)[1]
-        new_file_id = str(uuid.uuid4())
-        new_file_name = f"{new_file_id}{file_ext}"
-        new_file_key = f"uploads/{new_file_name}"
+            # Generate unique key for S3 unless the caller reserved one
+            new_file_key = key or new_s3_key(file_name)
         
-        # Upload to S3
-        with open(file_path, 'rb') as file_data:
-            s3_client.upload_fileobj(
-                file_data,
-                S3_BUCKET,
-                new_file_key,
-                ExtraArgs={
-                    'ContentType': 'application/pdf',
-                }
+            transfer_config = TransferConfig(
+                multipart_threshold=multipart_threshold_mb * 1024 * 1024,
+                multipart_chunksize=S3_MULTIPART_CHUNKSIZE_MB * 1024 * 1024,
+                max_concurrency=max_concurrency
             )
+            extra_args = {'ContentType': content_type}
+        
+            # Stream in-memory data directly; only plain paths are read from disk
+            if isinstance(source, (bytes, bytearray)):
+                source = BytesIO(source)
         
-        # Generate S3 URL
-        s3_url = f"https://{S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com/{new_file_key}"
-        print(f"Successfully uploaded to S3: {s3_url}")
+            if hasattr(source, 'read'):
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                s3_client.upload_fileobj(source, bucket, new_file_key, ExtraArgs=extra_args, Config=transfer_config)
+            else:
+                with open(source, 'rb') as file_data:
+                    s3_client.upload_fileobj(file_data, bucket, new_file_key, ExtraArgs=extra_args, Config=transfer_config)
         
-        return s3_url
+            # Generate S3 URL
+            s3_url = s3_url_for_key(new_file_key)
+            print(f"Successfully uploaded to S3: {s3_url}")
+        
+            return s3_url
         
     except Exception as e:
         print(f"Error uploading to S3: {e}")
         raise
 
-# ORIGINAL WORKING IMAGE FUNCTIONS - UNCHANGED
+# FILE-BASED IMAGE FUNCTIONS
 def compress_image(image_path, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
     """
     Compress an image to reduce file size while maintaining OCR readability.
@@ -182,42 +602,26 @@ def compress_image(image_path, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_D
         quality: JPEG quality (1-100)
     """
     try:
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Get original dimensions
-            width, height = img.size
+        with open_image(image_path, max_dimension) as img:
+            if is_conforming_jpeg(img, os.path.getsize(image_path), max_size_mb, max_dimension):
+                JPEG_PASSTHROUGH.inc()
+                print(f"Kept {os.path.basename(image_path)} as-is: already within the JPEG targets")
+                return
+            img = decode_upright(img, max_dimension)
             
-            # Calculate new dimensions while maintaining aspect ratio
-            if width > max_dimension or height > max_dimension:
-                if width > height:
-                    new_width = max_dimension
-                    new_height = int((height * max_dimension) / width)
-                else:
-                    new_height = max_dimension
-                    new_width = int((width * max_dimension) / height)
-                
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Save with compression
+            # Size-targeted encode happens in memory; only the result is written
+            jpeg_data, quality, passes = encode_jpeg(img, max_size_mb, quality)
+        
+        with time_stage("save"):
             temp_path = image_path + "_temp"
-            img.save(temp_path, "JPEG", quality=quality, optimize=True)
-            
-            # Check file size and adjust quality if needed
-            file_size_mb = os.path.getsize(temp_path) / (1024 * 1024)
-            
-            # If still too large, reduce quality further
-            while file_size_mb > max_size_mb and quality > 30:
-                quality -= 10
-                img.save(temp_path, "JPEG", quality=quality, optimize=True)
-                file_size_mb = os.path.getsize(temp_path) / (1024 * 1024)
+            with open(temp_path, 'wb') as f:
+                f.write(jpeg_data)
             
             # Replace original with compressed version
             shutil.move(temp_path, image_path)
-            
-            print(f"Compressed {os.path.basename(image_path)}: {file_size_mb:.2f}MB (quality: {quality})")
+        
+        file_size_mb = len(jpeg_data) / (1024 * 1024)
+        print(f"Compressed {os.path.basename(image_path)}: {file_size_mb:.2f}MB (quality: {quality}, passes: {passes})")
             
     except Exception as e:
         print(f"Error compressing image {image_path}: {str(e)}")
@@ -226,126 +630,592 @@ def compress_image(image_path, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_D
             os.remove(image_path + "_temp")
 
 def auto_rotate_image(image_path):
-    """Auto-rotate image based on EXIF orientation data."""
+    """Auto-rotate image based on EXIF orientation data, rewriting it only when needed."""
     try:
-        img = Image.open(image_path)
-        
-        # Handle EXIF orientation
-        for orientation in ExifTags.TAGS.keys():
-            if ExifTags.TAGS[orientation] == 'Orientation':
-                break
-        
-        exif = img._getexif()
-        if exif is not None:
-            orientation_value = exif.get(orientation)
-            if orientation_value == 3:
-                img = img.rotate(180, expand=True)
-            elif orientation_value == 6:
-                img = img.rotate(270, expand=True)
-            elif orientation_value == 8:
-                img = img.rotate(90, expand=True)
+        with open_image(image_path, max_dimension=None) as img:
+            orientation = get_exif_orientation(img)
+            if orientation not in ORIENTATION_TRANSPOSE:
+                return
+            
+            image_format = img.format
+            with time_stage("rotate"):
+                img = apply_exif_orientation(img, orientation)
         
-        img.save(image_path)
-        img.close()
-    except (AttributeError, KeyError, IndexError, TypeError):
-        # Image doesn't have EXIF data or other issues
-        pass
+        with time_stage("save"):
+            img.save(image_path, image_format)
+    except (OSError, ValueError, ImageRejected) as e:
+        print(f"Error rotating image {image_path}: {e}")
 
 def convert_img_to_pdf(images_paths, output_path):
     """
     Convert images to PDF in the correct order (front first, back second).
     
+    JPEG files are embedded as-is; other formats are encoded to JPEG once.
+    
     Args:
         images_paths: List of image file paths in the correct order
         output_path: Path where the PDF will be saved
     """
-    imgs = []
+    jpeg_images = []
     
-    # Process images in the order they were provided
+    # Process images in the order they were provided, one at a time
     for img_path in images_paths:
         if os.path.exists(img_path) and img_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img = Image.open(img_path).convert('RGB')  # ORIGINAL SIMPLE METHOD THAT WORKS
-            imgs.append(img)
+            with open(img_path, 'rb') as f:
+                image_data = f.read()
+            if not image_data.startswith(b'\xff\xd8'):
+                with open_image(BytesIO(image_data), max_dimension=None) as img:
+                    buffer = BytesIO()
+                    img.convert('RGB').save(buffer, "JPEG", quality=JPEG_QUALITY)
+                    image_data = buffer.getvalue()
+            jpeg_images.append(image_data)
             print(f"Added to PDF: {os.path.basename(img_path)}")
     
-    if len(imgs) == 0:
-        raise ValueError("No images to convert!")
+    pdf_buffer = build_pdf(jpeg_images)
+    with time_stage("save"), open(output_path, 'wb') as f:
+        f.write(pdf_buffer.getvalue())
+
+# IN-MEMORY IMAGE PIPELINE
+def get_exif_orientation(img):
+    """
+    Read the EXIF orientation from the already-parsed image header.
     
-    if len(imgs) < 2:
-        raise ValueError("Need at least 2 images for front and back of insurance card")
+    Image.open only reads headers, so this never decodes pixel data.
+    Returns 1 (upright) when the image has no usable orientation.
+    """
+    exif_data = img.info.get('exif')
+    if not exif_data:
+        return 1
+    try:
+        exif = Image.Exif()
+        exif.load(exif_data)
+        return exif.get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        # Malformed EXIF block; treat the image as upright
+        return 1
+
+def apply_exif_orientation(img, orientation=None):
+    """Return img transposed upright for its EXIF orientation (all eight values, mirrored included)."""
+    if orientation is None:
+        orientation = get_exif_orientation(img)
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    if method is None:
+        return img
+    return img.transpose(method)
+
+def draft_for_max_dimension(img, max_dimension=MAX_DIMENSION):
+    """
+    Let the JPEG decoder downscale via DCT scaling before any pixels are decoded.
+    
+    Picks the largest 1/2, 1/4 or 1/8 reduction that still leaves the long side
+    at or above max_dimension. Must be called before the image is loaded; it is
+    a no-op for non-JPEG images and images that are already small enough.
+    """
+    if img.format != 'JPEG':
+        return img
+    
+    width, height = img.size
+    scale = max_dimension / max(width, height)
+    if scale >= 1:
+        return img
     
-    # Save with first image as base, append the rest
-    imgs[0].save(output_path, save_all=True, append_images=imgs[1:])
-    print(f"PDF created with {len(imgs)} images in correct order")
+    img.draft(img.mode, (math.ceil(width * scale), math.ceil(height * scale)))
+    if img.size != (width, height):
+        print(f"Draft-decoding JPEG at {img.size[0]}x{img.size[1]} (from {width}x{height})")
+    return img
 
-def process_insurance_cards(images_folder, insurance_id=None, insurance_type='primary'):
+def resize_to_max_dimension(img, max_dimension=MAX_DIMENSION, resample=None, reducing_gap=None):
     """
-    Process insurance card images and upload to S3, optionally update database
+    Downscale img so neither side exceeds max_dimension, keeping aspect ratio.
+    
+    reducing_gap lets Pillow box-reduce by an integer factor first, which is
+    much faster for large reductions at practically the same quality.
+    """
+    width, height = img.size
+    if width <= max_dimension and height <= max_dimension:
+        return img
+    
+    if width > height:
+        new_width = max_dimension
+        new_height = int((height * max_dimension) / width)
+    else:
+        new_height = max_dimension
+        new_width = int((width * max_dimension) / height)
+    
+    if resample is None:
+        resample = Image.Resampling[RESIZE_FILTER.upper()]
+    return img.resize((new_width, new_height), resample, reducing_gap=reducing_gap)
+
+@contextmanager
+def open_image(source, max_dimension=MAX_DIMENSION, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Open an image within the decode memory limits.
+    
+    The pixel count is checked from the header (after JPEG draft
+    downscaling to max_dimension) before anything is decoded; images over
+    max_pixels raise ImageRejected. While the with-block runs, the decoded
+    size is reserved from the process MemoryBudget. The size stored in the
+    file, before drafting, is kept as img.header_size.
     
     Args:
-        images_folder: Path to folder containing images
-        insurance_id: Optional insurance ID for database update
-        insurance_type: Type of insurance ('primary' or 'secondary')
+        source: File path or file-like object
+        max_dimension: Long side the caller will resize to, or None to decode at full size
+        max_pixels: Largest decoded pixel count accepted
+    """
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(f"Image is too large to process: {e}")
+    
+    with img:
+        img.header_size = img.size
+        if max_dimension:
+            draft_for_max_dimension(img, max_dimension)
+        width, height = img.size
+        if width * height > max_pixels:
+            raise ImageRejected(
+                f"Image is too large to process ({width}x{height} pixels). "
+                f"Please upload images under {max_pixels // 1_000_000} megapixels."
+            )
+        
+        with get_memory_budget().reserve(width * height * DECODE_BYTES_PER_PIXEL * DECODE_WORKING_COPIES):
+            yield img
+
+def is_conforming_jpeg(img, data_size, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_DIMENSION):
+    """
+    Whether an opened upload can be used as a PDF page exactly as received.
+    
+    It must be an RGB or grayscale JPEG within max_dimension and max_size_mb
+    with no EXIF block, so it is upright and carries no camera metadata;
+    this is what the upload page's compressImage produces from the
+    upload_targets() settings. Only the header is inspected; the dimensions
+    checked are the stored ones, not those of a JPEG draft.
+    """
+    width, height = getattr(img, 'header_size', img.size)
+    return (
+        img.format == 'JPEG'
+        and img.mode in ('RGB', 'L')
+        and max(width, height) <= max_dimension
+        and data_size <= max_size_mb * 1024 * 1024
+        and not img.info.get('exif')
+    )
+
+def upload_targets():
+    """Image targets published to clients, so pre-shrunk uploads pass through without re-encoding"""
+    return {
+        "format": "image/jpeg",
+        "max_dimension": MAX_DIMENSION,
+        "jpeg_quality": JPEG_QUALITY,
+        "min_jpeg_quality": MIN_JPEG_QUALITY,
+        "max_file_size_bytes": int(MAX_FILE_SIZE_MB * 1024 * 1024),
+    }
+
+def decode_upright(img, max_dimension=MAX_DIMENSION):
+    """
+    Decode an opened image for the pipeline: draft-scaled where possible,
+    RGB or L, within max_dimension and rotated upright.
+    
+    Call inside the Image.open block; the result may be img itself.
+    """
+    orientation = get_exif_orientation(img)
+    with time_stage("decode"):
+        draft_for_max_dimension(img, max_dimension)
+        # Decode here so the pixel work is not billed to whichever stage touches it first
+        img.load()
+        
+        # Convert to RGB if necessary (for JPEG compatibility)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        
+        img = resize_to_max_dimension(img, max_dimension)
+    
+    # Rotate after resizing so the transpose works on the smaller image
+    with time_stage("rotate"):
+        img = apply_exif_orientation(img, orientation)
+    return img
+
+def encode_thumbnail(img, max_dimension=THUMBNAIL_MAX_DIMENSION, image_format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY):
+    """
+    Encode a small preview of an upright, decoded image.
     
     Returns:
-        str: S3 URL of uploaded PDF
+        tuple: (image bytes, file extension, content type)
     """
-    # Validate AWS credentials
-    if not all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION, S3_BUCKET]):
-        raise ValueError("Missing AWS credentials or S3 bucket configuration")
+    with time_stage("thumbnail"):
+        thumbnail = resize_to_max_dimension(img, max_dimension, Image.Resampling.LANCZOS, reducing_gap=1.5)
+        buffer = BytesIO()
+        if image_format.upper() == "WEBP" and features.check("webp"):
+            thumbnail.save(buffer, "WEBP", quality=quality)
+            return buffer.getvalue(), ".webp", "image/webp"
+        thumbnail.save(buffer, "JPEG", quality=quality, optimize=True)
+        return buffer.getvalue(), ".jpg", "image/jpeg"
+
+def encode_ocr_variant(img, quality=OCR_JPEG_QUALITY, cutoff=OCR_AUTOCONTRAST_CUTOFF):
+    """Encode a grayscale, contrast-stretched JPEG of an upright, decoded image for OCR"""
+    with time_stage("ocr_variant"):
+        gray = img if img.mode == 'L' else img.convert('L')
+        gray = ImageOps.autocontrast(gray, cutoff=cutoff)
+        buffer = BytesIO()
+        gray.save(buffer, "JPEG", quality=quality, optimize=True)
+        return buffer.getvalue()
+
+def encode_jpeg(img, max_size_mb=MAX_FILE_SIZE_MB, quality=JPEG_QUALITY,
+                min_quality=MIN_JPEG_QUALITY, max_passes=MAX_ENCODE_PASSES):
+    """
+    Encode an image to JPEG bytes in memory, targeting a maximum size.
     
-    # Validate database credentials file exists if insurance_id is provided
-    if insurance_id and not os.path.exists('game_db_credentials.json'):
-        raise ValueError("game_db_credentials.json file not found")
+    The first pass uses the requested quality. If that is too large, the
+    highest quality that fits is found by bisection between min_quality and
+    quality, stopping after max_passes encodes in total.
+    
+    Args:
+        img: PIL Image in a JPEG-compatible mode
+        max_size_mb: Maximum encoded size in MB
+        quality: Preferred JPEG quality (1-100)
+        min_quality: Lowest quality to try
+        max_passes: Maximum number of encodes
+    
+    Returns:
+        tuple: (JPEG bytes, quality used, number of encodes)
+    """
+    with time_stage("compress"):
+        jpeg_data, quality, passes = _encode_jpeg_to_budget(img, max_size_mb, quality, min_quality, max_passes)
+    JPEG_ENCODE_PASSES.observe(passes)
+    return jpeg_data, quality, passes
 
-    # For generic URL uploads (no insurance_id), also validate database credentials for interaction tracking
-    if not insurance_id and not os.path.exists('game_db_credentials.json'):
-        raise ValueError("game_db_credentials.json file not found")
+def _encode_jpeg_to_budget(img, max_size_mb, quality, min_quality, max_passes):
+    max_bytes = int(max_size_mb * 1024 * 1024)
     
-    all_files = os.listdir(images_folder)
-    image_files = [f for f in all_files if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    def encode(q):
+        buffer = BytesIO()
+        img.save(buffer, "JPEG", quality=q, optimize=True)
+        return buffer.getvalue()
     
-    # Sort by file modification time (which preserves upload order)
-    image_files.sort(key=lambda x: os.path.getmtime(os.path.join(images_folder, x)))
+    jpeg_data = encode(quality)
+    passes = 1
+    if len(jpeg_data) <= max_bytes or quality <= min_quality:
+        return jpeg_data, quality, passes
     
-    processed_images = []
+    # Bisect for the highest quality that still fits. If nothing fits within
+    # the pass budget, fall back to the smallest encode we produced.
+    best = None
+    smallest = (jpeg_data, quality)
+    low, high = min_quality, quality - 1
+    while low <= high and passes < max_passes:
+        mid = (low + high) // 2
+        candidate = encode(mid)
+        passes += 1
+        if len(candidate) <= max_bytes:
+            best = (candidate, mid)
+            low = mid + 1
+        else:
+            smallest = (candidate, mid)
+            high = mid - 1
     
-    for img_file in image_files:
-        img_path = os.path.join(images_folder, img_file)
-        
-        # Step 1: Auto-rotate based on EXIF
-        auto_rotate_image(img_path)
-        
-        # Step 2: Compress the image
-        compress_image(img_path)
-        
-        processed_images.append(img_path)
-        print(f"Processed image {len(processed_images)}: {img_file}")
+    jpeg_data, quality = best or smallest
+    return jpeg_data, quality, passes
+
+def prepare_image(image_data, file_name, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """
+    Decode an uploaded image once, fix its orientation, resize and compress it.
     
-    if len(processed_images) < 2:
-        raise ValueError("Need at least 2 images for front and back of insurance card")
+    Args:
+        image_data: Raw bytes of the uploaded image
+        file_name: Original file name (used for logging)
+        max_size_mb: Maximum file size in MB
+        max_dimension: Maximum width or height in pixels
+        quality: JPEG quality (1-100)
+    
+    Returns:
+        bytes: Compressed JPEG data
+    """
+    with open_image(BytesIO(image_data), max_dimension) as img:
+        if is_conforming_jpeg(img, len(image_data), max_size_mb, max_dimension):
+            JPEG_PASSTHROUGH.inc()
+            print(f"Using {file_name} as-is: {len(image_data) / (1024 * 1024):.2f}MB, already within the JPEG targets")
+            return image_data
+        img = decode_upright(img, max_dimension)
+        jpeg_data, quality, passes = encode_jpeg(img, max_size_mb, quality)
     
-    # Generate unique PDF filename using UUID
-    pdf_filename = f"{str(uuid.uuid4())}.pdf"
-    pdf_path = os.path.join(images_folder, pdf_filename)
+    print(f"Compressed {file_name}: {len(jpeg_data) / (1024 * 1024):.2f}MB (quality: {quality}, passes: {passes})")
+    return jpeg_data
+
+def prepare_card_side(image_data, file_name, max_size_mb=MAX_FILE_SIZE_MB, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """
+    Like prepare_image, but also derive the dashboard thumbnail and the OCR
+    variant from the same decoded image. A conforming JPEG is still decoded
+    for the derivatives but becomes the PDF page without re-encoding.
     
-    # Create PDF from processed images in correct order (front first, back second)
-    convert_img_to_pdf(processed_images, pdf_path)
+    Returns:
+        dict: "page" (JPEG bytes for the PDF), "thumbnail" ((bytes, extension,
+        content type)) and "ocr" (grayscale JPEG bytes)
+    """
+    with open_image(BytesIO(image_data), max_dimension) as img:
+        passthrough = is_conforming_jpeg(img, len(image_data), max_size_mb, max_dimension)
+        img = decode_upright(img, max_dimension)
+        if passthrough:
+            JPEG_PASSTHROUGH.inc()
+            jpeg_data, page_note = image_data, "as-is"
+        else:
+            jpeg_data, quality, passes = encode_jpeg(img, max_size_mb, quality)
+            page_note = f"quality: {quality}, passes: {passes}"
+        thumbnail = encode_thumbnail(img)
+        ocr_data = encode_ocr_variant(img)
+    
+    print(f"Prepared {file_name}: {len(jpeg_data) / (1024 * 1024):.2f}MB ({page_note}), "
+          f"thumbnail {len(thumbnail[0]) / 1024:.0f}KB, OCR variant {len(ocr_data) / 1024:.0f}KB")
+    return {"page": jpeg_data, "thumbnail": thumbnail, "ocr": ocr_data}
+
+def build_pdf(jpeg_images, page_size=PDF_PAGE_SIZE, resolution=PDF_RESOLUTION):
+    """
+    Build a PDF in memory from compressed JPEG images (front first, back second).
+    
+    The JPEG bytes are embedded directly (DCTDecode), so pages are not
+    decoded or recompressed and keep the size targeting from encode_jpeg.
     
-    # Upload to S3
-    s3_url = upload_to_s3(pdf_path, pdf_filename)
+    Args:
+        jpeg_images: List of JPEG bytes in the correct order
+        page_size: Page size name from pdf_writer.PAGE_SIZES or (width, height) in points
+        resolution: Pixels per inch when pages are sized to the image
+    
+    Returns:
+        BytesIO: Buffer containing the PDF
+    """
+    if len(jpeg_images) == 0:
+        raise ValueError("No images to convert!")
+    
+    if len(jpeg_images) < 2:
+        raise ValueError("Need at least 2 images for front and back of insurance card")
+    
+    with time_stage("pdf"):
+        pdf_buffer = BytesIO(write_jpeg_pdf(jpeg_images, page_size, resolution))
+    print(f"PDF created with {len(jpeg_images)} images in correct order ({pdf_buffer.getbuffer().nbytes / 1024:.0f}KB)")
+    return pdf_buffer
+
+def validate_configuration():
+    """Ensure S3 and database settings are available before processing"""
+    # Validate AWS credentials
+    if not all([config.AWS_ACCESS_KEY_ID, config.AWS_SECRET_ACCESS_KEY, config.AWS_REGION, config.S3_BUCKET]):
+        raise ValueError("Missing AWS credentials or S3 bucket configuration")
+    
+    # Database credentials are needed both for insurance_id updates and for
+    # interaction tracking on generic URL uploads
+    if not os.path.exists('game_db_credentials.json'):
+        raise ValueError("game_db_credentials.json file not found")
+
+def record_upload(s3_url, upload_future, insurance_id, insurance_type):
+    """Write the DB records for an upload, committing only once the upload has finished"""
+    if DB_WRITE_BATCHING:
+        record_upload_batched(s3_url, upload_future, insurance_id, insurance_type)
+        return
     
     # Update database if insurance_id is provided
     if insurance_id:
-        update_insurance_card_in_db(insurance_id, s3_url, insurance_type)
+        update_insurance_card_in_db(insurance_id, s3_url, insurance_type, before_commit=upload_future.result)
     
-
     # FEATURE: Insert interaction record ONLY for generic URL uploads (no insurance_id)
     # URLs with specific insurance_id (like /308) will NOT create interaction records
     if not insurance_id:
         try:
-            insert_interaction_record(s3_url, insurance_type)
+            insert_interaction_record(s3_url, insurance_type, before_commit=upload_future.result)
         except Exception as e:
             print(f"Warning: Failed to insert interaction record: {e}")
+    
+    # Surface upload failures even when the interaction insert swallowed them
+    upload_future.result()
+
+def record_upload_batched(s3_url, upload_future, insurance_id, insurance_type):
+    """Same as record_upload, but through the shared write-behind DbWriteBatcher"""
+    upload_future.result()
+    
+    if insurance_id:
+        get_db_batcher().submit_card_update(insurance_id, s3_url, insurance_type).result()
+    else:
+        try:
+            get_db_batcher().submit_interaction(s3_url, insurance_type).result()
+        except Exception as e:
+            print(f"Warning: Failed to insert interaction record: {e}")
+
+def get_dedup_cache():
+    """Return the process-wide duplicate-upload cache"""
+    global _dedup_cache
+    with _dedup_cache_lock:
+        if _dedup_cache is None:
+            _dedup_cache = ContentCache(DEDUP_CACHE_SIZE, DEDUP_CACHE_PATH)
+        return _dedup_cache
+
+def upload_cache_key(uploads):
+    """SHA-256 over the uploaded image bytes (in order) and the settings that shape the PDF and its derivatives"""
+    digest = hashlib.sha256()
+    settings = (MAX_FILE_SIZE_MB, MAX_DIMENSION, JPEG_QUALITY, MIN_JPEG_QUALITY, MAX_ENCODE_PASSES, RESIZE_FILTER,
+                PDF_PAGE_SIZE, PDF_RESOLUTION,
+                THUMBNAIL_MAX_DIMENSION, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY, OCR_JPEG_QUALITY, OCR_AUTOCONTRAST_CUTOFF)
+    digest.update(repr(settings).encode())
+    for _, image_data in uploads:
+        # Length prefix keeps (a, bc) and (ab, c) distinct
+        digest.update(len(image_data).to_bytes(8, 'big'))
+        digest.update(image_data)
+    return digest.hexdigest()
+
+def get_pipeline_executor():
+    """Return the shared thread pool for per-image work and background S3 uploads"""
+    global _pipeline_executor
+    with _pipeline_executor_lock:
+        if _pipeline_executor is None:
+            _pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+        return _pipeline_executor
+
+def reset_after_fork():
+    """
+    Forget clients, pools and threads inherited from a parent process.
+    
+    Sockets and executor threads do not survive fork, so a freshly forked
+    worker must build its own; the lazy getters recreate them on first use.
+    """
+    global _s3_client, _s3_client_lock, _dedup_cache, _dedup_cache_lock
+    global _pipeline_executor, _pipeline_executor_lock
+    global _db_pool, _db_pool_slots, _db_pool_lock, _db_last_used, _db_batcher, _db_batcher_lock
+    global _memory_budget, _memory_budget_lock
+    _s3_client, _s3_client_lock = None, threading.Lock()
+    _dedup_cache, _dedup_cache_lock = None, threading.Lock()
+    _pipeline_executor, _pipeline_executor_lock = None, threading.Lock()
+    # Dropped without closeall(): the sockets belong to the parent
+    _db_pool, _db_pool_slots, _db_pool_lock, _db_last_used = None, None, threading.Lock(), {}
+    _db_batcher, _db_batcher_lock = None, threading.Lock()
+    _memory_budget, _memory_budget_lock = None, threading.Lock()
+
+def shutdown():
+    """Let in-flight pipeline work (S3 uploads) finish, flush queued DB writes and close the pool"""
+    if _pipeline_executor is not None:
+        _pipeline_executor.shutdown(wait=True)
+    if _db_batcher is not None:
+        _db_batcher.close()
+    if _db_pool is not None:
+        _db_pool.closeall()
+
+def card_side_name(index):
+    """"front", "back", then "page3", "page4", ... for extra images"""
+    return CARD_SIDES[index] if index < len(CARD_SIDES) else f"page{index + 1}"
+
+def gather_futures(futures):
+    """
+    Combine futures into one that resolves to their results once all have
+    finished, or to the first failure (still only after all have finished).
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([future.result() for future in futures])
+    
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+def process_insurance_card_uploads(uploads, insurance_id=None, insurance_type='primary'):
+    """
+    Process uploaded insurance card images entirely in memory and upload to S3.
+    
+    Besides the PDF, each side gets a small thumbnail and a grayscale OCR
+    variant, made from the same decoded image and uploaded alongside it
+    under keys that share the PDF's UUID.
+    
+    Args:
+        uploads: List of (file_name, image_bytes) tuples in upload order
+        insurance_id: Optional insurance ID for database update
+        insurance_type: Type of insurance ('primary' or 'secondary')
+    
+    Returns:
+        dict: "link" (S3 URL of the PDF) and "derivatives" ({side: {"thumbnail": url, "ocr": url}})
+    """
+    validate_configuration()
+    
+    # Resubmitted photos (retries, double-taps) reuse the existing PDF and
+    # derivatives; only the DB records are written again
+    cache_key = upload_cache_key(uploads)
+    cached = get_dedup_cache().get(cache_key)
+    if cached:
+        result = json.loads(cached)
+        print(f"Duplicate upload detected, reusing {result['link']}")
+        upload_future = Future()
+        upload_future.set_result(result['link'])
+        record_upload(result['link'], upload_future, insurance_id, insurance_type)
+        return result
+    
+    executor = get_pipeline_executor()
+    
+    # Pillow releases the GIL while decoding/encoding, so front and back
+    # are processed concurrently; map() keeps them in upload order
+    # propagate_context keeps the pool's stage timings attached to this request
+    sides = list(executor.map(propagate_context(lambda upload: prepare_card_side(upload[1], upload[0])), uploads))
+    print(f"Processed {len(sides)} images: {', '.join(name for name, _ in uploads)}")
+    
+    # Create PDF from processed images in correct order (front first, back second)
+    pdf_buffer = build_pdf([side["page"] for side in sides])
+    
+    # Reserve the S3 keys up front so the DB statements can run while the
+    # uploads are in flight; each transaction only commits once all have finished
+    pdf_key = new_s3_key("card.pdf")
+    s3_url = s3_url_for_key(pdf_key)
+    key_prefix = os.path.splitext(pdf_key)[0]
+    
+    artifacts = [(pdf_buffer, pdf_key, 'application/pdf')]
+    derivatives = {}
+    for index, side in enumerate(sides):
+        side_name = card_side_name(index)
+        thumbnail_data, thumbnail_ext, thumbnail_type = side["thumbnail"]
+        thumbnail_key = f"{key_prefix}_{side_name}_thumbnail{thumbnail_ext}"
+        ocr_key = f"{key_prefix}_{side_name}_ocr.jpg"
+        artifacts.append((thumbnail_data, thumbnail_key, thumbnail_type))
+        artifacts.append((side["ocr"], ocr_key, 'image/jpeg'))
+        derivatives[side_name] = {"thumbnail": s3_url_for_key(thumbnail_key), "ocr": s3_url_for_key(ocr_key)}
+    
+    upload_future = gather_futures([
+        executor.submit(propagate_context(upload_to_s3), data, key, content_type, key=key)
+        for data, key, content_type in artifacts
+    ])
+    result = {"link": s3_url, "derivatives": derivatives}
+    
+    def remember_upload(future):
+        if future.exception() is None:
+            get_dedup_cache().set(cache_key, json.dumps(result))
+    
+    upload_future.add_done_callback(remember_upload)
+    
+    record_upload(s3_url, upload_future, insurance_id, insurance_type)
 
-    return s3_url
\ No newline at end of file
+    return result
+
+def process_insurance_cards(images_folder, insurance_id=None, insurance_type='primary'):
+    """
+    Process insurance card images and upload to S3, optionally update database
+    
+    Args:
+        images_folder: Path to folder containing images
+        insurance_id: Optional insurance ID for database update
+        insurance_type: Type of insurance ('primary' or 'secondary')
+    
+    Returns:
+        dict: "link" (S3 URL of the PDF) and "derivatives", as from process_insurance_card_uploads
+    """
+    all_files = os.listdir(images_folder)
+    image_files = [f for f in all_files if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    
+    # Sort by file modification time (which preserves upload order)
+    image_files.sort(key=lambda x: os.path.getmtime(os.path.join(images_folder, x)))
+    
+    uploads = []
+    for img_file in image_files:
+        with open(os.path.join(images_folder, img_file), 'rb') as f:
+            uploads.append((img_file, f.read()))
+    
+    return process_insurance_card_uploads(uploads, insurance_id, insurance_type)
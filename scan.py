@@ -1,34 +1,77 @@
 import os
-from google.api_core.client_options import ClientOptions
-from google.cloud import documentai
-from dotenv import load_dotenv
-from openai import OpenAI
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import re
 from PIL import Image
-from google.oauth2 import service_account
-from googleapiclient.http import MediaFileUpload
-from googleapiclient.discovery import build
+from card_fields import extract_fields, format_fields, FIELDS
+from cache import ContentCache
+from config import config, load_env
 
-load_dotenv()
+# Run as a script, let .env set the settings below; the Google and OpenAI
+# SDKs are imported by the functions that use them
+if __name__ == "__main__":
+    load_env()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SCOPES = ['https://www.googleapis.com/auth/drive']
-FOLDER_ID = os.getenv('FOLDER_ID')
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "credentials.json"
 project_id = "insurancecardscarping"
 location = "us" 
 processor_display_name = "insurance_card_scraper"
 output_json_path = "ocr_output.json"
 
+# Resolved processor names are cached on disk so a new run skips list_processors
+PROCESSOR_CACHE_PATH = os.getenv("PROCESSOR_CACHE_PATH", ".documentai_processor_cache.json")
+PROCESSOR_CACHE_TTL = int(os.getenv("PROCESSOR_CACHE_TTL", str(24 * 60 * 60)))  # seconds
+
+# Folder pipeline concurrency and retry settings
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))   # Images OCR'd at once
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))   # Cards extracted at once
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))  # seconds, doubled per attempt
+
+# Fields the local extractor is at least this sure of skip the LLM; bare
+# "ID:", "Group:" and "Name:" matches score below it and are confirmed
+LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_CONFIDENCE_THRESHOLD", "0.9"))
+
+# Persistent OCR results, keyed by image hash + the processor's default version
+# (as resolved by resolve_processor_name, so a new version is picked up within
+# PROCESSOR_CACHE_TTL)
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", ".cache/ocr_cache.sqlite3")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+
+_ocr_cache = None
+_documentai_clients = {}
+_processor_names = {}
+_processor_lock = threading.Lock()
+_documentai_lock = threading.Lock()
+
+def with_retries(func, *args, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, **kwargs):
+    """Call func, retrying failures with exponential backoff and jitter"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) * (0.5 + random.random())
+            print(f"Attempt {attempt}/{attempts} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
 def make_open_ai_client(openai_api_key):
+    from openai import OpenAI
     return OpenAI(api_key = openai_api_key)
 
 def get_or_create_processor(client, parent, processor_display_name):
+    """Return the Processor with this display name, creating an OCR processor if there is none"""
+    from google.cloud import documentai
     for processor in client.list_processors(parent=parent):
         if processor.display_name == processor_display_name:
             print(f"Found existing processor: {processor.name}")
-            return processor.name
+            return processor
     processor = client.create_processor(
         parent=parent,
         processor=documentai.Processor(
@@ -37,11 +80,89 @@ def get_or_create_processor(client, parent, processor_display_name):
         ),
     )
     print(f"Created new processor: {processor.name}")
-    return processor.name
+    return processor
 
-def analyze_all(data, client, max_tokens=2000):
+def get_documentai_client(location):
+    """Return a shared Document AI client for the location, creating it on first use"""
+    with _documentai_lock:
+        if location not in _documentai_clients:
+            from google.api_core.client_options import ClientOptions
+            from google.cloud import documentai
+            # Respect credentials the environment already points at
+            os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", config.GOOGLE_APPLICATION_CREDENTIALS)
+            opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+            _documentai_clients[location] = documentai.DocumentProcessorServiceClient(client_options=opts)
+        return _documentai_clients[location]
+
+def _read_processor_cache(cache_path):
     try:
-        response = client.chat.completions.create(
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_ocr_cache():
+    """Return the process-wide OCR result cache"""
+    global _ocr_cache
+    with _documentai_lock:
+        if _ocr_cache is None:
+            _ocr_cache = ContentCache(256, OCR_CACHE_PATH, OCR_CACHE_MAX_MB * 1024 * 1024)
+        return _ocr_cache
+
+def ocr_cache_key(image_content, processor_name, processor_version):
+    """SHA-256 of the image bytes plus the processor and the version that serves it"""
+    digest = hashlib.sha256()
+    digest.update(f"{processor_name}@{processor_version}\0".encode())
+    digest.update(image_content)
+    return digest.hexdigest()
+
+def resolve_processor_name(client, project_id, location, processor_display_name,
+                           cache_path=PROCESSOR_CACHE_PATH, ttl=PROCESSOR_CACHE_TTL):
+    """
+    Look up the processor once per process, reusing a disk entry younger than ttl seconds.
+    
+    client may be None; the location's shared client is only needed when
+    the processor has to be looked up.
+    
+    Returns:
+        tuple: (processor name, its default processor version)
+    """
+    cache_key = f"{project_id}/{location}/{processor_display_name}"
+    # Its own lock, held while looking up, so concurrent pages wait for one
+    # list_processors call instead of each making one
+    with _processor_lock:
+        if cache_key in _processor_names:
+            return _processor_names[cache_key]
+
+        disk_cache = _read_processor_cache(cache_path) if cache_path else {}
+        entry = disk_cache.get(cache_key)
+        # Entries written before versions were recorded are looked up again
+        if entry and "version" in entry and time.time() - entry["resolved_at"] < ttl:
+            _processor_names[cache_key] = (entry["name"], entry["version"])
+            return _processor_names[cache_key]
+
+        client = client or get_documentai_client(location)
+        parent = client.common_location_path(project_id, location)
+        processor = get_or_create_processor(client, parent, processor_display_name)
+        processor_name = processor.name
+        _processor_names[cache_key] = (processor_name, processor.default_processor_version)
+
+        if cache_path:
+            disk_cache[cache_key] = {"name": processor_name, "version": processor.default_processor_version,
+                                     "resolved_at": time.time()}
+            temp_path = cache_path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(disk_cache, f)
+            os.replace(temp_path, cache_path)
+        return _processor_names[cache_key]
+
+def analyze_all(data, client, max_tokens=2000, fields=None):
+    if fields is None:
+        fields = FIELDS
+    field_list = "\n".join(fields)
+    try:
+        response = with_retries(
+            client.chat.completions.create,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an assistant that summarizes, analyzes text, and presents text in a given format."},
@@ -49,7 +170,7 @@ def analyze_all(data, client, max_tokens=2000):
                     "role": "user",
                     "content": f"""Here is the text data from a patient's insurance card: \n\n{data}\n\n
                                     Please extract the following information:\n
-                                    Insurance Company Name\nPatient First Name\nPatient Last Name\nMember ID\nGroup ID/ Group Number\nInsurance Plan\n
+                                    {field_list}\n
                                     DO NOT ADD ANY FORMATTING TO THE INFORMATION THAT YOU GIVE ME.
                                 """
                 }
@@ -61,22 +182,55 @@ def analyze_all(data, client, max_tokens=2000):
         print(f"Error analyzing text with OpenAI: {e}")
         return ["Analysis failed for one or more chunks."]
 
+def extract_card_details(combined_text, llm_extract, threshold=LOCAL_CONFIDENCE_THRESHOLD):
+    """
+    Extract card details locally, asking the LLM only for low-confidence fields.
+    
+    Args:
+        combined_text: OCR text of all of a card's pages
+        llm_extract: Callable (text, fields) returning "Key: value" lines, e.g. analyze_all
+        threshold: Minimum local confidence for a field to be trusted
+    
+    Returns:
+        str: "Key: value" lines, the same shape analyze_all produces
+    """
+    local_fields = extract_fields(combined_text)
+    confident = {field: value for field, (value, confidence) in local_fields.items() if confidence >= threshold}
+    uncertain = [field for field in FIELDS if field not in confident]
+    if not uncertain:
+        print("All card fields extracted locally; skipping LLM")
+        return format_fields(confident)
+    
+    print(f"Asking LLM for low-confidence fields: {', '.join(uncertain)}")
+    analysis = llm_extract(combined_text, uncertain)
+    llm_fields = convert_to_dictionary(analysis) if isinstance(analysis, str) else {}
+    llm_fields.update(confident)
+    return "\n".join(f"{field}: {value}" for field, value in llm_fields.items())
+
 def write_to_text_file(file_path, text):
     with open(file_path, "a") as text_file:
         text_file.write(text)
 
-def quickstart(project_id, location, processor_display_name, output_json_path, client_openai, file_path):
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
-    parent = client.common_location_path(project_id, location)
-    processor_name = get_or_create_processor(client, parent, processor_display_name)
-    combined_text = ""
+def quickstart(project_id, location, processor_display_name, output_json_path, client_openai, file_path, client=None):
+    """OCR one image with Document AI; pass client to use a specific (or fake) DocumentProcessorServiceClient"""
     with open(file_path, "rb") as image:
         image_content = image.read()
+    
+    # Identical images are never sent to the same processor version twice
+    processor_name, processor_version = resolve_processor_name(client, project_id, location, processor_display_name)
+    cache_key = ocr_cache_key(image_content, processor_name, processor_version)
+    cached_text = get_ocr_cache().get(cache_key)
+    if cached_text is not None:
+        print(f"Processed Image (cached): {file_path}")
+        return cached_text
+    
+    from google.cloud import documentai
+    client = client or get_documentai_client(location)
     raw_document = documentai.RawDocument(content=image_content, mime_type="image/jpeg")
     request = documentai.ProcessRequest(name=processor_name, raw_document=raw_document)
     result = client.process_document(request=request)
     document = result.document
+    get_ocr_cache().set(cache_key, document.text)
     print(f"Processed Image: {file_path}")
     return document.text
 
@@ -127,11 +281,14 @@ def convert_img_to_pdf(images_path, output_path):
     print(f"PDF saved successfully as: {output_path}")
 
 def authenticate_services():
-    credentials = service_account.Credentials.from_service_account_file('credentials.json', scopes=SCOPES)
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    credentials = service_account.Credentials.from_service_account_file(config.GOOGLE_APPLICATION_CREDENTIALS, scopes=SCOPES)
     drive_service = build('drive', 'v3', credentials=credentials)
     return drive_service
 
 def upload_file_to_drive(drive_service, file_path, file_name, folder_id):
+    from googleapiclient.http import MediaFileUpload
     file_metadata = {'name': file_name}
     if folder_id:
         file_metadata['parents'] = [folder_id]
@@ -142,25 +299,122 @@ def upload_file_to_drive(drive_service, file_path, file_name, folder_id):
     shareable_link = f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
     return shareable_link
 
-def main():
+def find_cards(images_root):
+    """
+    Group the images under images_root into cards.
+    
+    Each subdirectory holding images is one card; images directly in
+    images_root form one more card (the original single-card layout).
+    
+    Returns:
+        list: (card_folder, [image paths]) tuples in name order
+    """
+    valid_extensions = (".jpg", ".jpeg", ".png")
+    cards = []
+    for dir_path, dir_names, file_names in os.walk(images_root):
+        dir_names.sort()
+        pages = [os.path.join(dir_path, f) for f in sorted(file_names) if f.lower().endswith(valid_extensions)]
+        if pages:
+            cards.append((dir_path, pages))
+    return cards
+
+def run_card_pipeline(cards, ocr, extract, ocr_concurrency=OCR_CONCURRENCY, llm_concurrency=LLM_CONCURRENCY):
+    """
+    OCR every page concurrently and extract each card as soon as its pages are done.
+    
+    Args:
+        cards: (card_folder, [image paths]) tuples, as returned by find_cards
+        ocr: Callable taking an image path and returning its text
+        extract: Callable taking a card's combined text and returning the analysis
+        ocr_concurrency: Maximum OCR calls in flight
+        llm_concurrency: Maximum extraction calls in flight
+    
+    Yields:
+        tuple: (card_folder, combined_text, analysis) in completion order
+    
+    A card whose OCR (after retries) or extraction fails is reported and
+    skipped; the other cards are still yielded.
+    """
+    with ThreadPoolExecutor(max_workers=ocr_concurrency) as ocr_pool, \
+            ThreadPoolExecutor(max_workers=llm_concurrency) as llm_pool:
+        cards_by_folder = dict(cards)
+        page_texts = {card_folder: [None] * len(pages) for card_folder, pages in cards}
+        remaining = {card_folder: len(pages) for card_folder, pages in cards}
+        page_futures = {}
+        for card_folder, pages in cards:
+            for index, page in enumerate(pages):
+                page_futures[ocr_pool.submit(with_retries, ocr, page)] = (card_folder, index)
+        
+        extract_futures = {}
+        failed = set()
+        pending = set(page_futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in extract_futures:
+                    card_folder, combined_text = extract_futures.pop(future)
+                    try:
+                        analysis = future.result()
+                    except Exception as e:
+                        print(f"Card failed ({card_folder}): extraction error: {e}")
+                        continue
+                    yield card_folder, combined_text, analysis
+                    continue
+                
+                card_folder, index = page_futures.pop(future)
+                if card_folder in failed:
+                    continue
+                try:
+                    page_texts[card_folder][index] = future.result()
+                except Exception as e:
+                    failed.add(card_folder)
+                    print(f"Card failed ({card_folder}): OCR error on {cards_by_folder[card_folder][index]}: {e}")
+                    continue
+                remaining[card_folder] -= 1
+                if remaining[card_folder] == 0:
+                    combined_text = "".join(text + "\n" for text in page_texts[card_folder])
+                    extract_future = llm_pool.submit(extract, combined_text)
+                    extract_futures[extract_future] = (card_folder, combined_text)
+                    pending.add(extract_future)
+
+def main(ocr=None, extract=None, images_root="./insuranceCardImages"):
+    """
+    Scan every card under images_root, extract its details and upload its PDF to Drive.
+    
+    ocr and extract default to Document AI and OpenAI; pass local callables
+    (same signatures as in run_card_pipeline) to run without either service.
+    """
     delete_folder("Output")
-    client_openai = make_open_ai_client(OPENAI_API_KEY)
-    faxes_file_path = "./insuranceCardImages"
-    combined_text = ""
-    for file in os.listdir(faxes_file_path):
-        file_path = os.path.join("./insuranceCardImages", file)
-        text = quickstart(project_id, location, processor_display_name, output_json_path, client_openai, file_path)
-        combined_text += text + "\n"
-    analysis_results = analyze_all(combined_text, client_openai, 500)
-    output_dict = convert_to_dictionary(analysis_results)
+    if ocr is None:
+        ocr = lambda file_path: quickstart(project_id, location, processor_display_name, output_json_path, None, file_path)
+    if extract is None:
+        client_openai = make_open_ai_client(config.OPENAI_API_KEY)
+        llm_extract = lambda combined_text, fields: analyze_all(combined_text, client_openai, 500, fields)
+        extract = lambda combined_text: extract_card_details(combined_text, llm_extract)
+    
     os.makedirs("./Output", exist_ok=True)
-    write_to_text_file('./Output/OCR_results.txt', combined_text)
-    write_to_text_file('./Output/Chatgpt_results.txt', analysis_results)
-    output_dict = make_output_path(output_dict['Patient First Name'], output_dict['Patient Last Name'])
-    convert_img_to_pdf("./insuranceCardImages", output_dict['File Path'])
-    drive_service = authenticate_services()
-    shareable_link = upload_file_to_drive(drive_service, output_dict['File Path'], output_dict['File Name'], FOLDER_ID)
-    print(f"Final Shareable Link: {shareable_link}")
+    drive_service = None
+    for card_folder, combined_text, analysis_results in run_card_pipeline(find_cards(images_root), ocr, extract):
+        # One card without usable details (e.g. the LLM failed or found no
+        # name) must not stop the rest of the folder
+        try:
+            if not isinstance(analysis_results, str):
+                raise ValueError("no card details were extracted")
+            output_dict = convert_to_dictionary(analysis_results)
+            write_to_text_file('./Output/OCR_results.txt', combined_text)
+            write_to_text_file('./Output/Chatgpt_results.txt', analysis_results)
+            output_dict = make_output_path(output_dict['Patient First Name'], output_dict['Patient Last Name'])
+            convert_img_to_pdf(card_folder, output_dict['File Path'])
+            if drive_service is None:
+                drive_service = authenticate_services()
+            shareable_link = upload_file_to_drive(drive_service, output_dict['File Path'], output_dict['File Name'], config.FOLDER_ID)
+        except KeyError as e:
+            print(f"Card failed ({card_folder}): no {e.args[0]} in the extracted details")
+            continue
+        except Exception as e:
+            print(f"Card failed ({card_folder}): {e}")
+            continue
+        print(f"Final Shareable Link ({card_folder}): {shareable_link}")
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,102 @@
+"""
+Production entry point: serves app.py with gunicorn.
+
+    python serve.py
+
+Workers are forked from a master that has already imported the app and the
+heavy libraries (boto3, psycopg2, Pillow), so each worker starts warm and
+shares those pages copy-on-write. Clients, pools and executor threads are
+created per worker after fork. On shutdown or restart a worker stops
+accepting connections, finishes in-flight requests, then drains queued
+async jobs and pending DB writes before exiting.
+
+Metrics are per worker; /metrics reports the worker that answered. Async
+jobs run in the worker that accepted them, but their state is kept in
+JOB_STORE_PATH, so /jobs/<id> can be polled through any worker.
+"""
+import os
+from gunicorn.app.base import BaseApplication
+from config import load_env
+
+# .env may set the SERVER_* settings below as well as the pipeline's
+load_env()
+
+# Server settings
+SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:8004")
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))   # Processes; image work is CPU-bound
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "4"))                         # Per worker; requests mostly wait on S3/DB
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", "120"))                       # Seconds before a stuck worker is restarted
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "60"))      # Seconds to drain on shutdown
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))                     # Seconds to hold idle proxy connections
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))               # Recycle workers after this many requests (0 = never)
+
+def preload_heavy_imports():
+    """Import the large libraries in the master so forked workers inherit them"""
+    import boto3
+    import boto3.s3.transfer
+    import botocore.session
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+    from PIL import Image
+
+    # Register all image plugins now rather than on a worker's first upload
+    Image.init()
+    # Loading the service model is the slow part of the first client
+    botocore.session.get_session().get_service_model('s3')
+
+def post_fork(server, worker):
+    import jobs
+    import processing
+    processing.reset_after_fork()
+    jobs.reset_after_fork()
+
+def worker_exit(server, worker):
+    import jobs
+    import processing
+    # Jobs first: they may still be using the pipeline pool and the DB
+    jobs.shutdown()
+    processing.shutdown()
+
+class CardServer(BaseApplication):
+    """Gunicorn application configured from the SERVER_* settings"""
+
+    def __init__(self, application=None, options=None):
+        self.application = application
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.application is None:
+            from app import app
+            self.application = app
+        return self.application
+
+def server_options():
+    return {
+        'bind': SERVER_BIND,
+        'workers': SERVER_WORKERS,
+        'worker_class': 'gthread',
+        'threads': SERVER_THREADS,
+        'timeout': SERVER_TIMEOUT,
+        'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': SERVER_KEEPALIVE,
+        'max_requests': SERVER_MAX_REQUESTS,
+        'max_requests_jitter': SERVER_MAX_REQUESTS // 10,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+def run(application=None):
+    """Serve application (default: app.app) until the master is stopped"""
+    preload_heavy_imports()
+    print(f"Serving on {SERVER_BIND} with {SERVER_WORKERS} workers x {SERVER_THREADS} threads")
+    CardServer(application, server_options()).run()
+
+if __name__ == '__main__':
+    run()
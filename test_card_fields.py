@@ -0,0 +1,102 @@
+"""
+card_fields.extract_fields on representative OCR text.
+
+Each case lists the fields that should be trusted, i.e. extracted at or
+above scan's LOCAL_CONFIDENCE_THRESHOLD; anything else must go to the LLM.
+
+    python -m pytest test_card_fields.py
+"""
+import pytest
+
+from card_fields import (
+    extract_fields,
+    format_fields,
+    FIELDS,
+    INSURANCE_COMPANY,
+    FIRST_NAME,
+    LAST_NAME,
+    MEMBER_ID,
+    GROUP_NUMBER,
+    INSURANCE_PLAN,
+)
+from scan import LOCAL_CONFIDENCE_THRESHOLD
+
+def trusted_fields(text):
+    return {field: value for field, (value, confidence) in extract_fields(text).items()
+            if confidence >= LOCAL_CONFIDENCE_THRESHOLD}
+
+CASES = [
+    pytest.param(
+        "Cigna\nMember ID: U1234567\nGroup #: 3340001\nMember Name: JOHN Q PUBLIC\nPlan: Open Access Plus",
+        {INSURANCE_COMPANY: "Cigna", MEMBER_ID: "U1234567", GROUP_NUMBER: "3340001",
+         FIRST_NAME: "JOHN", LAST_NAME: "PUBLIC", INSURANCE_PLAN: "Open Access Plus"},
+        id="labelled-layout",
+    ),
+    pytest.param(
+        "BlueCross BlueShield\nSubscriber ID XYZ123456789\nGroup Number 0705123\nName: DOE, JANE",
+        {INSURANCE_COMPANY: "Blue Cross Blue Shield", MEMBER_ID: "XYZ123456789", GROUP_NUMBER: "0705123",
+         FIRST_NAME: "JANE", LAST_NAME: "DOE"},
+        id="last-comma-first",
+    ),
+    pytest.param(
+        "UnitedHealthcare\nChoice Plus\nSubscriber: Jane Doe\nMember ID 912345678",
+        {INSURANCE_COMPANY: "UnitedHealthcare", MEMBER_ID: "912345678", FIRST_NAME: "Jane", LAST_NAME: "Doe"},
+        id="subscriber-label",
+    ),
+    pytest.param(
+        "Aetna\nUnitedHealthcare\nMember ID: W1234567",
+        {MEMBER_ID: "W1234567"},
+        id="several-payers-are-ambiguous",
+    ),
+    # Bare labels only hint at a field; the LLM confirms them
+    pytest.param(
+        "Humana\nID: H12345678\nGroup: 55501\nName: Jane Doe",
+        {INSURANCE_COMPANY: "Humana"},
+        id="bare-labels",
+    ),
+    # Regressions
+    pytest.param(
+        "UnitedHealthcare\nPayer ID: 87726\nMember: JANE DOE",
+        {INSURANCE_COMPANY: "UnitedHealthcare", FIRST_NAME: "JANE", LAST_NAME: "DOE"},
+        id="payer-id-is-not-member-id",
+    ),
+    pytest.param(
+        "Group ID: 0705123\nID: W987654321",
+        {GROUP_NUMBER: "0705123"},
+        id="group-id-is-not-member-id",
+    ),
+    pytest.param(
+        "Aetna\nPlan Name: Open Access\nRx ID: 55555",
+        {INSURANCE_COMPANY: "Aetna", INSURANCE_PLAN: "Open Access"},
+        id="plan-name-is-not-patient-name",
+    ),
+    pytest.param(
+        "Aetna\nSubscriber:\nGroup Number 12345\nMember ID W1234567",
+        {INSURANCE_COMPANY: "Aetna", GROUP_NUMBER: "12345", MEMBER_ID: "W1234567"},
+        id="empty-name-label-does-not-take-next-line",
+    ),
+    pytest.param(
+        "Acme Benefits\nMember Name: Oscar Martinez\nMember ID: A12345678",
+        {FIRST_NAME: "Oscar", LAST_NAME: "Martinez", MEMBER_ID: "A12345678"},
+        id="first-name-is-not-a-payer",
+    ),
+    pytest.param(
+        "Aetna\n123 Main St, Oxford, MS\nMember ID: W1234567",
+        {INSURANCE_COMPANY: "Aetna", MEMBER_ID: "W1234567"},
+        id="city-is-not-a-payer",
+    ),
+    pytest.param(
+        "Oscar Health\nMember ID: 00123456",
+        {INSURANCE_COMPANY: "Oscar Health", MEMBER_ID: "00123456"},
+        id="full-payer-name-is-trusted",
+    ),
+]
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_trusted_fields(text, expected):
+    assert trusted_fields(text) == expected
+
+def test_format_fields_uses_field_order():
+    values = {INSURANCE_PLAN: "PPO", FIRST_NAME: "Jane", INSURANCE_COMPANY: "Aetna"}
+    assert format_fields(values) == "Insurance Company Name: Aetna\nPatient First Name: Jane\nInsurance Plan: PPO"
+    assert FIELDS[-1] == INSURANCE_PLAN
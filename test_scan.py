@@ -0,0 +1,179 @@
+"""
+scan.py against a local fake Document AI client; no Google credentials or
+network access needed.
+
+    python -m pytest test_scan.py
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import scan
+
+PROJECT_ID = "test-project"
+LOCATION = "us"
+DISPLAY_NAME = "insurance_card_scraper"
+
+class FakeDocumentAIClient:
+    """Counts calls; OCR text is derived from the image bytes"""
+
+    def __init__(self, processor_version="pretrained-ocr-v1"):
+        self.processor_version = processor_version
+        self.list_processors_calls = 0
+        self.process_document_calls = 0
+
+    def common_location_path(self, project_id, location):
+        return f"projects/{project_id}/locations/{location}"
+
+    def list_processors(self, parent):
+        self.list_processors_calls += 1
+        return [SimpleNamespace(
+            name=f"{parent}/processors/abc123",
+            display_name=DISPLAY_NAME,
+            default_processor_version=f"{parent}/processors/abc123/processorVersions/{self.processor_version}",
+        )]
+
+    def process_document(self, request):
+        self.process_document_calls += 1
+        text = request.raw_document.content.decode()
+        return SimpleNamespace(document=SimpleNamespace(text=f"{text} ({self.processor_version})"))
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Fresh in-process state, with the processor and OCR cache files under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scan, "_processor_names", {})
+    monkeypatch.setattr(scan, "_ocr_cache", None)
+
+def write_images(tmp_path, *contents):
+    paths = []
+    for index, content in enumerate(contents):
+        path = tmp_path / f"card_{index}.jpg"
+        path.write_bytes(content.encode())
+        paths.append(str(path))
+    return paths
+
+def ocr(client, file_path):
+    return scan.quickstart(PROJECT_ID, LOCATION, DISPLAY_NAME, None, None, file_path, client=client)
+
+def test_processor_is_resolved_once_for_many_images(tmp_path):
+    client = FakeDocumentAIClient()
+    paths = write_images(tmp_path, "front", "back", "secondary front")
+
+    texts = [ocr(client, path) for path in paths]
+
+    assert texts == ["front (pretrained-ocr-v1)", "back (pretrained-ocr-v1)", "secondary front (pretrained-ocr-v1)"]
+    assert client.list_processors_calls == 1
+    assert client.process_document_calls == len(paths)
+
+def test_processor_cache_file_is_reused_by_a_new_process(tmp_path, monkeypatch):
+    paths = write_images(tmp_path, "front", "back")
+    ocr(FakeDocumentAIClient(), paths[0])
+    entry = json.loads((tmp_path / scan.PROCESSOR_CACHE_PATH).read_text())[f"{PROJECT_ID}/{LOCATION}/{DISPLAY_NAME}"]
+    assert entry["name"].endswith("/processors/abc123")
+
+    # A new process starts with no names in memory
+    monkeypatch.setattr(scan, "_processor_names", {})
+    client = FakeDocumentAIClient()
+    ocr(client, paths[1])
+
+    assert client.list_processors_calls == 0
+    assert client.process_document_calls == 1
+
+def test_expired_processor_cache_entry_is_looked_up_again(tmp_path):
+    client = FakeDocumentAIClient()
+    cache_path = str(tmp_path / "processors.json")
+    scan.resolve_processor_name(client, PROJECT_ID, LOCATION, DISPLAY_NAME, cache_path=cache_path)
+    scan._processor_names.clear()
+
+    scan.resolve_processor_name(client, PROJECT_ID, LOCATION, DISPLAY_NAME, cache_path=cache_path, ttl=0)
+
+    assert client.list_processors_calls == 2
+
+def test_repeated_image_is_served_from_the_ocr_cache(tmp_path):
+    client = FakeDocumentAIClient()
+    path, = write_images(tmp_path, "front")
+
+    assert ocr(client, path) == ocr(client, path)
+    assert client.process_document_calls == 1
+
+def test_new_processor_version_invalidates_cached_ocr(tmp_path, monkeypatch):
+    path, = write_images(tmp_path, "front")
+    assert ocr(FakeDocumentAIClient("pretrained-ocr-v1"), path) == "front (pretrained-ocr-v1)"
+
+    # The processor entry expires and the lookup finds a new default version
+    monkeypatch.setattr(scan, "_processor_names", {})
+    (tmp_path / scan.PROCESSOR_CACHE_PATH).unlink()
+    client = FakeDocumentAIClient("pretrained-ocr-v2")
+
+    assert ocr(client, path) == "front (pretrained-ocr-v2)"
+    assert client.process_document_calls == 1
+
+def make_card_folders(tmp_path, **cards):
+    """One subdirectory per card, holding its pages in order"""
+    for card_name, contents in cards.items():
+        (tmp_path / card_name).mkdir()
+        write_images(tmp_path / card_name, *contents)
+    return scan.find_cards(str(tmp_path))
+
+def test_card_pipeline_ocrs_each_page_once_and_keeps_page_order(tmp_path):
+    client = FakeDocumentAIClient()
+    cards = make_card_folders(tmp_path, card_a=["a front", "a back"], card_b=["b front", "b back"])
+
+    results = {card_folder: combined_text
+               for card_folder, combined_text, _ in scan.run_card_pipeline(cards, lambda path: ocr(client, path), str.upper)}
+
+    assert results == {
+        str(tmp_path / "card_a"): "a front (pretrained-ocr-v1)\na back (pretrained-ocr-v1)\n",
+        str(tmp_path / "card_b"): "b front (pretrained-ocr-v1)\nb back (pretrained-ocr-v1)\n",
+    }
+    assert client.list_processors_calls == 1
+    assert client.process_document_calls == 4
+
+def test_card_pipeline_skips_failed_cards_and_yields_the_rest(tmp_path, monkeypatch):
+    # No backoff between the OCR retries
+    monkeypatch.setattr(scan.time, "sleep", lambda seconds: None)
+    client = FakeDocumentAIClient()
+    cards = make_card_folders(tmp_path, card_a=["a front", "a back"], card_b=["unreadable", "b back"],
+                              card_c=["c front", "c back"])
+
+    def flaky_ocr(path):
+        if open(path).read() == "unreadable":
+            raise RuntimeError("Document AI unavailable")
+        return ocr(client, path)
+
+    def extract(combined_text):
+        if combined_text.startswith("c front"):
+            raise RuntimeError("LLM unavailable")
+        return combined_text.upper()
+
+    results = [card_folder for card_folder, _, _ in scan.run_card_pipeline(cards, flaky_ocr, extract)]
+
+    assert results == [str(tmp_path / "card_a")]
+
+def test_main_skips_cards_without_usable_details(tmp_path, monkeypatch):
+    images_root = tmp_path / "images"
+    for card_name in ("card_a", "card_b", "card_c"):
+        (images_root / card_name).mkdir(parents=True)
+        Image.new("RGB", (60, 40), "white").save(images_root / card_name / "front.jpg")
+    uploads = []
+    monkeypatch.setattr(scan, "authenticate_services", lambda: "drive")
+    monkeypatch.setattr(scan, "upload_file_to_drive",
+                        lambda drive_service, file_path, file_name, folder_id: uploads.append(file_name) or file_name)
+
+    extracted = {
+        # The LLM call failed: analyze_all's error sentinel
+        "card_a": ["Analysis failed for one or more chunks."],
+        # No patient name found locally or by the LLM
+        "card_b": "Insurance Company Name: Aetna\nMember ID: W1234567",
+        "card_c": "Patient First Name: Jane\nPatient Last Name: Doe",
+    }
+    scan.main(ocr=lambda path: os.path.basename(os.path.dirname(path)),
+              extract=lambda combined_text: extracted[combined_text.strip()],
+              images_root=str(images_root))
+
+    assert uploads == ["JaneDoeInsuranceCard.pdf"]
+    assert (tmp_path / "Output" / "JaneDoeInsuranceCard.pdf").exists()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from flask import Request
+from errors import RequestRejected
+
+# Upload validation settings
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+MAX_UPLOAD_FILES = 2                                                               # Front and back
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))         # Per-file limit
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(1024 * 1024)))  # Larger files spill to disk
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+SNIFF_BYTES = len(PNG_MAGIC)
+
+class UploadRejected(RequestRejected):
+    """
+    Raised while the multipart body is still streaming in.
+
+    Deliberately not a ValueError: Werkzeug's form parser silently swallows
+    those and would hand the view an empty form instead.
+    """
+
+    status_code = 400
+
+class SniffingUploadStream:
+    """
+    Write target for one uploaded file.
+
+    The first bytes are checked against the JPEG/PNG signatures as soon as
+    they arrive, and the running size against MAX_IMAGE_BYTES, so a bad or
+    oversized upload is rejected before the rest of it is read. Accepted
+    data is spooled in memory up to UPLOAD_SPOOL_MAX_MEMORY, then to disk.
+    """
+
+    def __init__(self, filename, max_bytes=MAX_IMAGE_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.bytes_written = 0
+        self._head = b''
+        self._file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.bytes_written > self.max_bytes:
+            raise UploadRejected(
+                f"File {self.filename} is too large. Please upload images under {self.max_bytes // (1024 * 1024)}MB each.",
+                413
+            )
+
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_signature()
+        return self._file.write(data)
+
+    def _check_signature(self):
+        if not (self._head.startswith(JPEG_MAGIC) or self._head.startswith(PNG_MAGIC)):
+            raise UploadRejected(f"File {self.filename} is not a valid JPG, JPEG, or PNG image.")
+
+    def seek(self, *args):
+        # The parser seeks back to the start once the part is complete;
+        # files shorter than the signature are caught here
+        if len(self._head) < SNIFF_BYTES:
+            self._check_signature()
+        return self._file.seek(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class ValidatingRequest(Request):
+    """Flask request that validates image uploads while the body is being parsed"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Empty file inputs (no file chosen) arrive as parts without a filename
+        if not filename:
+            return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+
+        self._upload_count = getattr(self, '_upload_count', 0) + 1
+        if self._upload_count > MAX_UPLOAD_FILES:
+            raise UploadRejected("Please upload exactly two images (front and back of insurance card).")
+
+        file_ext = os.path.splitext(filename.lower())[1]
+        if file_ext not in ALLOWED_EXTENSIONS:
+            raise UploadRejected(f"File {filename} must be a JPG, JPEG, or PNG image.")
+
+        if content_length and content_length > MAX_IMAGE_BYTES:
+            raise UploadRejected(
+                f"File {filename} is too large. Please upload images under {MAX_IMAGE_BYTES // (1024 * 1024)}MB each.",
+                413
+            )
+
+        return SniffingUploadStream(filename, MAX_IMAGE_BYTES)